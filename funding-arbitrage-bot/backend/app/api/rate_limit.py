@@ -0,0 +1,67 @@
+"""
+接口限流 - 按客户端 IP + 路由的令牌桶
+"""
+
+import math
+import time
+from typing import Dict, Tuple
+from fastapi import HTTPException, Request, Response
+
+
+class RateLimiter:
+    """令牌桶限流依赖，用法: Depends(RateLimiter(5, 60))"""
+
+    # 桶数量超过该值时清理已回满的桶，避免内存无限增长
+    MAX_BUCKETS = 10000
+
+    def __init__(self, times: int, seconds: float, methods: Tuple[str, ...] = ()):
+        self.capacity = times
+        self.seconds = seconds
+        self.refill_per_sec = times / seconds
+        # 为空表示对所有方法生效
+        self.methods = methods
+        self._buckets: Dict[Tuple[str, str], Tuple[float, float]] = {}
+
+    def _key(self, request: Request) -> Tuple[str, str]:
+        route = request.scope.get('route')
+        path = getattr(route, 'path', request.url.path)
+        client = request.client.host if request.client else 'unknown'
+        return client, path
+
+    def _prune(self, now: float):
+        # 超过 seconds 未访问的桶已回满，删除等价于重置
+        self._buckets = {
+            k: v for k, v in self._buckets.items()
+            if now - v[1] < self.seconds
+        }
+
+    async def __call__(self, request: Request, response: Response):
+        if self.methods and request.method not in self.methods:
+            return
+
+        now = time.monotonic()
+        key = self._key(request)
+
+        tokens, last = self._buckets.get(key, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - last) * self.refill_per_sec)
+
+        if tokens < 1:
+            retry_after = math.ceil((1 - tokens) / self.refill_per_sec)
+            self._buckets[key] = (tokens, now)
+            raise HTTPException(
+                status_code=429,
+                detail="请求过于频繁，请稍后再试",
+                headers={
+                    "Retry-After": str(retry_after),
+                    "X-RateLimit-Limit": str(self.capacity),
+                    "X-RateLimit-Remaining": "0",
+                }
+            )
+
+        tokens -= 1
+        if key not in self._buckets and len(self._buckets) >= self.MAX_BUCKETS:
+            self._prune(now)
+        self._buckets[key] = (tokens, now)
+
+        response.headers["X-RateLimit-Limit"] = str(self.capacity)
+        response.headers["X-RateLimit-Remaining"] = str(int(tokens))
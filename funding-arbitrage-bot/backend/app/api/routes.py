@@ -1,11 +1,43 @@
+import asyncio
+import logging
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 from decimal import Decimal
-from ..app_state import get_app_state
-
-
-router = APIRouter()
+from datetime import datetime
+from sqlalchemy import select, cast, Float
+from sqlalchemy.orm import Session
+from ..database import get_db, get_db_context, upsert
+from ..models import ArbitrageOrder, Symbol
+from ..utils.cache import TTLCache
+from .rate_limit import RateLimiter
+from ..app_state import (
+    get_lighter,
+    get_binance,
+    get_collector,
+    get_engine,
+    get_executor,
+    get_position_manager,
+    get_pnl_calculator,
+    get_modules_snapshot,
+)
+
+
+logger = logging.getLogger(__name__)
+
+# 读接口每个 IP 每分钟 100 次；下单接口另有更严格的限制
+router = APIRouter(dependencies=[Depends(RateLimiter(100, 60, methods=('GET',)))])
+_order_rate_limit = RateLimiter(5, 60)
+
+# 前端轮询接口的短时缓存，?force_refresh=true 可跳过
+_opportunities_cache = TTLCache(ttl=5)
+_positions_cache = TTLCache(ttl=3)
+_funding_rates_cache = TTLCache(ttl=10)
+
+
+async def _none():
+    """占位协程，用于未初始化的客户端"""
+    return None
 
 
 # ============================================
@@ -40,34 +72,50 @@ class SymbolUpdate(BaseModel):
     enabled: bool
 
 
+class OrderOut(BaseModel):
+    """订单列表项"""
+    order_id: str
+    symbol: str
+    strategy_type: str
+    status: str
+    lighter_side: str
+    binance_side: str
+    lighter_entry_amount: float
+    binance_entry_amount: float
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
+
+class OrdersResponse(BaseModel):
+    """订单列表响应"""
+    success: bool
+    data: List[OrderOut]
+
+
 # ============================================
 # 配置相关 API
 # ============================================
 
 @router.get("/status")
-async def get_system_status():
+async def get_system_status(
+    lighter=Depends(get_lighter),
+    binance=Depends(get_binance),
+    modules=Depends(get_modules_snapshot)
+):
     """获取系统状态"""
     try:
-        state = get_app_state()
-        
-        lighter = state.get('lighter_client')
-        binance = state.get('binance_client')
-        
-        # 获取余额
-        lighter_balance = None
-        binance_balance = None
+        # 并发获取两个交易所的余额，任一失败按 0 处理
+        lighter_balance, binance_balance = await asyncio.gather(
+            lighter.get_balance() if lighter else _none(),
+            binance.get_balance() if binance else _none(),
+            return_exceptions=True
+        )
         
-        if lighter:
-            try:
-                lighter_balance = await lighter.get_balance()
-            except:
-                pass
+        if isinstance(lighter_balance, Exception):
+            lighter_balance = None
         
-        if binance:
-            try:
-                binance_balance = await binance.get_balance()
-            except:
-                pass
+        if isinstance(binance_balance, Exception):
+            binance_balance = None
         
         return {
             "success": True,
@@ -80,19 +128,11 @@ async def get_system_status():
                     "connected": binance is not None and getattr(binance, 'initialized', False),
                     "balance": float(binance_balance) if binance_balance else 0
                 },
-                "modules": {
-                    "data_collector": state.get('data_collector') is not None,
-                    "strategy_engine": state.get('strategy_engine') is not None,
-                    "order_executor": state.get('order_executor') is not None,
-                    "risk_manager": state.get('risk_manager') is not None,
-                    "position_manager": state.get('position_manager') is not None,
-                    "pnl_calculator": state.get('pnl_calculator') is not None
-                }
+                "modules": modules
             }
         }
     except Exception as e:
-        import traceback
-        logger.error(f"获取系统状态失败: {traceback.format_exc()}")
+        logger.exception("获取系统状态失败")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/config")
@@ -100,10 +140,7 @@ async def update_config(config: ConfigUpdate):
     """更新配置"""
     try:
         # 注意：这里只返回确认，实际配置需要修改 .env 文件并重启服务
-        updates = {}
-        for key, value in config.dict(exclude_unset=True).items():
-            if value is not None:
-                updates[key] = value
+        updates = config.model_dump(exclude_none=True)
         
         # TODO: 将来可以实现动态更新 strategy_engine 的配置
         # 目前返回成功但提示需要重启
@@ -114,9 +151,7 @@ async def update_config(config: ConfigUpdate):
             "data": updates
         }
     except Exception as e:
-        import traceback
-        error_detail = traceback.format_exc()
-        logger.error(f"更新配置失败: {error_detail}")
+        logger.exception("更新配置失败")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -125,16 +160,16 @@ async def update_config(config: ConfigUpdate):
 # ============================================
 
 @router.get("/opportunities")
-async def get_opportunities():
+async def get_opportunities(force_refresh: bool = False, engine=Depends(get_engine)):
     """获取当前的套利机会"""
     try:
-        state = get_app_state()
-        engine = state.get('strategy_engine')
-        
         if not engine:
             raise HTTPException(status_code=500, detail="策略引擎未初始化")
         
-        opportunities = engine.get_all_opportunities()
+        opportunities = None if force_refresh else _opportunities_cache.get('opportunities')
+        if opportunities is None:
+            opportunities = engine.get_all_opportunities()
+            _opportunities_cache.set('opportunities', opportunities)
         
         return {
             "success": True,
@@ -145,12 +180,9 @@ async def get_opportunities():
 
 
 @router.get("/funding-rates")
-async def get_funding_rates():
+async def get_funding_rates(force_refresh: bool = False, collector=Depends(get_collector)):
     """获取所有交易对的费率数据"""
     try:
-        state = get_app_state()
-        collector = state.get('data_collector')
-        
         if not collector:
             # 如果采集器未初始化，返回空数据
             return {
@@ -158,15 +190,17 @@ async def get_funding_rates():
                 "data": {}
             }
         
-        rate_diffs = collector.get_all_rate_diffs()
+        rate_diffs = None if force_refresh else _funding_rates_cache.get('funding_rates')
+        if rate_diffs is None:
+            rate_diffs = collector.get_all_rate_diffs()
+            _funding_rates_cache.set('funding_rates', rate_diffs)
         
         return {
             "success": True,
             "data": rate_diffs
         }
     except Exception as e:
-        import traceback
-        logger.error(f"获取费率数据失败: {traceback.format_exc()}")
+        logger.exception("获取费率数据失败")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -174,14 +208,15 @@ async def get_funding_rates():
 # 订单管理 API
 # ============================================
 
-@router.post("/orders/open")
-async def open_position(request: OpenPositionRequest):
+@router.post("/orders/open", dependencies=[Depends(_order_rate_limit)])
+async def open_position(
+    request: OpenPositionRequest,
+    engine=Depends(get_engine),
+    executor=Depends(get_executor),
+    lighter=Depends(get_lighter)
+):
     """手动建仓"""
     try:
-        state = get_app_state()
-        engine = state.get('strategy_engine')
-        executor = state.get('order_executor')
-        
         if not engine or not executor:
             raise HTTPException(status_code=500, detail="模块未初始化")
         
@@ -198,8 +233,6 @@ async def open_position(request: OpenPositionRequest):
         )
         
         # 计算止损止盈
-        from ..exchanges.lighter_client import LighterClient
-        lighter = state.get('lighter_client')
         current_price = await lighter.get_price(request.symbol)
         
         stop_loss, take_profit = engine.calculate_stop_loss_take_profit(
@@ -213,10 +246,10 @@ async def open_position(request: OpenPositionRequest):
             lighter_side=opportunity['lighter_side'],
             binance_side=opportunity['binance_side'],
             target_amount=Decimal(str(request.target_amount)),
-            amount_per_order=Decimal(str(engine.config['position_size_per_order'])),
+            amount_per_order=engine.position_size_dec,
             leverage=leverage,
             strategy_type=opportunity['strategy_type'],
-            max_imbalance=Decimal(str(engine.config['max_imbalance'])),
+            max_imbalance=engine.max_imbalance_dec,
             stop_loss_price=stop_loss,
             take_profit_price=take_profit
         )
@@ -237,30 +270,30 @@ async def open_position(request: OpenPositionRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.post("/orders/close")
-async def close_position(request: ClosePositionRequest):
+@router.post("/orders/close", dependencies=[Depends(_order_rate_limit)])
+async def close_position(
+    request: ClosePositionRequest,
+    executor=Depends(get_executor),
+    engine=Depends(get_engine),
+    calculator=Depends(get_pnl_calculator)
+):
     """手动平仓"""
     try:
-        state = get_app_state()
-        executor = state.get('order_executor')
-        engine = state.get('strategy_engine')
-        
         if not executor or not engine:
             raise HTTPException(status_code=500, detail="模块未初始化")
         
         # 执行平仓
         success = await executor.execute_close_position(
             request.order_id,
-            Decimal(str(engine.config['position_size_per_order']))
+            engine.position_size_dec
         )
         
         if not success:
             raise HTTPException(status_code=500, detail="平仓失败")
         
         # 计算盈亏
-        calculator = state.get('pnl_calculator')
         if calculator:
-            pnl = calculator.calculate_order_pnl(request.order_id)
+            pnl = await asyncio.to_thread(calculator.calculate_order_pnl, request.order_id)
         else:
             pnl = None
         
@@ -278,39 +311,36 @@ async def close_position(request: ClosePositionRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.get("/orders")
-async def get_orders(status: Optional[str] = None):
-    """获取订单列表"""
+@router.get("/orders", response_model=OrdersResponse)
+def get_orders(status: Optional[str] = None):
+    """获取订单列表（同步数据库查询，由 FastAPI 放到线程池执行）"""
     try:
-        from ..database import get_db_context
-        from ..models import ArbitrageOrder
+        # 只查询需要返回的列，金额在 SQL 中转换为浮点数
+        stmt = select(
+            ArbitrageOrder.order_id,
+            ArbitrageOrder.symbol,
+            ArbitrageOrder.strategy_type,
+            ArbitrageOrder.status,
+            ArbitrageOrder.lighter_side,
+            ArbitrageOrder.binance_side,
+            cast(ArbitrageOrder.lighter_entry_amount, Float).label('lighter_entry_amount'),
+            cast(ArbitrageOrder.binance_entry_amount, Float).label('binance_entry_amount'),
+            ArbitrageOrder.created_at,
+            ArbitrageOrder.updated_at,
+        )
+        
+        if status:
+            stmt = stmt.where(ArbitrageOrder.status == status)
+        
+        stmt = stmt.order_by(ArbitrageOrder.created_at.desc()).limit(100)
         
         with get_db_context() as db:
-            query = db.query(ArbitrageOrder)
-            
-            if status:
-                query = query.filter(ArbitrageOrder.status == status)
+            rows = db.execute(stmt).mappings().all()
             
-            orders = query.order_by(ArbitrageOrder.created_at.desc()).limit(100).all()
-            
-            return {
-                "success": True,
-                "data": [
-                    {
-                        "order_id": o.order_id,
-                        "symbol": o.symbol,
-                        "strategy_type": o.strategy_type,
-                        "status": o.status,
-                        "lighter_side": o.lighter_side,
-                        "binance_side": o.binance_side,
-                        "lighter_entry_amount": float(o.lighter_entry_amount),
-                        "binance_entry_amount": float(o.binance_entry_amount),
-                        "created_at": o.created_at.isoformat(),
-                        "updated_at": o.updated_at.isoformat() if o.updated_at else None
-                    }
-                    for o in orders
-                ]
-            }
+            return OrdersResponse(
+                success=True,
+                data=[OrderOut(**r) for r in rows]
+            )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -320,16 +350,19 @@ async def get_orders(status: Optional[str] = None):
 # ============================================
 
 @router.get("/positions")
-async def get_positions():
+async def get_positions(
+    force_refresh: bool = False,
+    manager=Depends(get_position_manager)
+):
     """获取当前持仓"""
     try:
-        state = get_app_state()
-        manager = state.get('position_manager')
-        
         if not manager:
             raise HTTPException(status_code=500, detail="持仓管理器未初始化")
         
-        positions = await manager.get_all_positions()
+        # 缓存结果可能被并发请求共用，不传入请求级会话，由持仓管理器自行创建
+        positions = await _positions_cache.get_or_set(
+            'positions', manager.get_all_positions, force_refresh
+        )
         
         return {
             "success": True,
@@ -339,47 +372,48 @@ async def get_positions():
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.get("/positions/{order_id}")
-async def get_position_detail(order_id: str):
-    """获取持仓详情"""
+@router.get("/positions/summary")
+def get_position_summary(
+    manager=Depends(get_position_manager),
+    db: Session = Depends(get_db)
+):
+    """获取持仓汇总"""
     try:
-        state = get_app_state()
-        manager = state.get('position_manager')
-        
         if not manager:
             raise HTTPException(status_code=500, detail="持仓管理器未初始化")
         
-        position = await manager.get_position_detail(order_id)
-        
-        if not position:
-            raise HTTPException(status_code=404, detail="持仓不存在")
+        summary = manager.get_position_summary(db)
         
         return {
             "success": True,
-            "data": position
+            "data": summary
         }
-    except HTTPException:
-        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.get("/positions/summary")
-async def get_position_summary():
-    """获取持仓汇总"""
+@router.get("/positions/{order_id}")
+async def get_position_detail(
+    order_id: str,
+    manager=Depends(get_position_manager),
+    db: Session = Depends(get_db)
+):
+    """获取持仓详情"""
     try:
-        state = get_app_state()
-        manager = state.get('position_manager')
-        
         if not manager:
             raise HTTPException(status_code=500, detail="持仓管理器未初始化")
         
-        summary = manager.get_position_summary()
+        position = await manager.get_position_detail(order_id, db)
+        
+        if not position:
+            raise HTTPException(status_code=404, detail="持仓不存在")
         
         return {
             "success": True,
-            "data": summary
+            "data": position
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -389,12 +423,9 @@ async def get_position_summary():
 # ============================================
 
 @router.get("/pnl/total")
-async def get_total_pnl(days: int = 30):
+def get_total_pnl(days: int = 30, calculator=Depends(get_pnl_calculator)):
     """获取总盈亏统计"""
     try:
-        state = get_app_state()
-        calculator = state.get('pnl_calculator')
-        
         if not calculator:
             raise HTTPException(status_code=500, detail="盈亏计算器未初始化")
         
@@ -409,12 +440,9 @@ async def get_total_pnl(days: int = 30):
 
 
 @router.get("/pnl/history")
-async def get_pnl_history(limit: int = 50):
+def get_pnl_history(limit: int = 50, calculator=Depends(get_pnl_calculator)):
     """获取盈亏历史"""
     try:
-        state = get_app_state()
-        calculator = state.get('pnl_calculator')
-        
         if not calculator:
             raise HTTPException(status_code=500, detail="盈亏计算器未初始化")
         
@@ -429,12 +457,9 @@ async def get_pnl_history(limit: int = 50):
 
 
 @router.get("/pnl/{order_id}")
-async def get_order_pnl(order_id: str):
+def get_order_pnl(order_id: str, calculator=Depends(get_pnl_calculator)):
     """获取订单盈亏"""
     try:
-        state = get_app_state()
-        calculator = state.get('pnl_calculator')
-        
         if not calculator:
             raise HTTPException(status_code=500, detail="盈亏计算器未初始化")
         
@@ -453,59 +478,14 @@ async def get_order_pnl(order_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-# ============================================
-# 系统状态 API
-# ============================================
-
-@router.get("/status")
-async def get_system_status():
-    """获取系统状态"""
-    try:
-        state = get_app_state()
-        
-        lighter = state.get('lighter_client')
-        binance = state.get('binance_client')
-        
-        # 获取余额
-        lighter_balance = await lighter.get_balance() if lighter else None
-        binance_balance = await binance.get_balance() if binance else None
-        
-        return {
-            "success": True,
-            "data": {
-                "lighter": {
-                    "connected": lighter is not None,
-                    "balance": float(lighter_balance) if lighter_balance else 0
-                },
-                "binance": {
-                    "connected": binance is not None,
-                    "balance": float(binance_balance) if binance_balance else 0
-                },
-                "modules": {
-                    "data_collector": state.get('data_collector') is not None,
-                    "strategy_engine": state.get('strategy_engine') is not None,
-                    "order_executor": state.get('order_executor') is not None,
-                    "risk_manager": state.get('risk_manager') is not None,
-                    "position_manager": state.get('position_manager') is not None,
-                    "pnl_calculator": state.get('pnl_calculator') is not None
-                }
-            }
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-
 # ============================================
 # 交易对管理 API
 # ============================================
 
 @router.get("/symbols")
-async def get_symbols():
-    """获取交易对列表"""
+def get_symbols():
+    """获取交易对列表（同步数据库查询，由 FastAPI 放到线程池执行）"""
     try:
-        from ..database import get_db_context
-        from ..models import Symbol
-        
         with get_db_context() as db:
             symbols = db.query(Symbol).all()
             
@@ -527,26 +507,17 @@ async def get_symbols():
 
 
 @router.post("/symbols")
-async def update_symbol(update: SymbolUpdate):
-    """更新交易对状态"""
+def update_symbol(update: SymbolUpdate):
+    """更新交易对状态（同步数据库写入，由 FastAPI 放到线程池执行）"""
     try:
-        from ..database import get_db_context
-        from ..models import Symbol
-        
         with get_db_context() as db:
-            symbol = db.query(Symbol).filter(
-                Symbol.symbol == update.symbol
-            ).first()
-            
-            if symbol:
-                symbol.enabled = update.enabled
-            else:
-                # 创建新交易对
-                symbol = Symbol(
-                    symbol=update.symbol,
-                    enabled=update.enabled
-                )
-                db.add(symbol)
+            # 不存在则创建，存在则更新启用状态
+            db.execute(upsert(
+                db, Symbol,
+                {'symbol': update.symbol, 'enabled': update.enabled},
+                index_elements=['symbol'],
+                update_columns=['enabled', 'updated_at']
+            ))
         
         return {
             "success": True,
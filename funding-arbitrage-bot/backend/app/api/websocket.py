@@ -2,109 +2,183 @@ from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 import asyncio
 import json
 import logging
-from ..app_state import get_app_state
+import time
+from ..utils.json_codec import dumps, loads
+from ..app_state import get_collector, get_position_manager
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-# 存储活跃的 WebSocket 连接
-active_connections: list[WebSocket] = []
+# 单个连接发送超时（秒），避免慢客户端拖慢整轮广播
+SEND_TIMEOUT = 1.0
+
+# 快照消息中可订阅的频道
+SNAPSHOT_CHANNELS = ('funding_rates', 'positions')
+
+# 单个端点允许的最大连接数
+MAX_CONNECTIONS = 500
+
+# 固定内容的控制消息，模块加载时序列化一次
+PONG_MESSAGE = dumps({"type": "pong"})
+INVALID_JSON_MESSAGE = dumps({"type": "error", "message": "Invalid JSON"})
 
 
 class ConnectionManager:
     """WebSocket 连接管理器"""
     
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
+    def __init__(self, max_connections: int = MAX_CONNECTIONS):
+        self.max_connections = max_connections
+        self.active_connections: set[WebSocket] = set()
+        # 连接订阅的频道，未订阅的连接接收全部频道
+        self.subscriptions: dict[WebSocket, set] = {}
     
-    async def connect(self, websocket: WebSocket):
+    async def connect(self, websocket: WebSocket) -> bool:
+        """接受连接，超过连接上限时以 1013 (Try Again Later) 关闭并返回 False"""
         await websocket.accept()
-        self.active_connections.append(websocket)
+        if len(self.active_connections) >= self.max_connections:
+            logger.warning(f"WebSocket 连接数已达上限 {self.max_connections}，拒绝新连接")
+            await websocket.close(code=1013)
+            return False
+        
+        self.active_connections.add(websocket)
         logger.info(f"WebSocket 连接建立，当前连接数: {len(self.active_connections)}")
+        return True
     
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+        if websocket not in self.active_connections:
+            return
+        self.active_connections.discard(websocket)
+        self.subscriptions.pop(websocket, None)
         logger.info(f"WebSocket 连接断开，当前连接数: {len(self.active_connections)}")
     
     async def send_personal_message(self, message: str, websocket: WebSocket):
         await websocket.send_text(message)
     
+    def subscribe(self, websocket: WebSocket, channel: str):
+        """记录连接订阅的频道"""
+        self.subscriptions.setdefault(websocket, set()).add(channel)
+    
     async def broadcast(self, message: dict):
-        """广播消息给所有连接"""
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                logger.error(f"发送消息失败: {e}")
+        """并发广播消息给所有连接，发送失败或超时的连接会被移除"""
+        await self._send_all(list(self.active_connections), dumps(message))
+    
+    async def broadcast_snapshot(self, fields: dict):
+        """按订阅频道合并为一条 snapshot 消息推送，相同订阅的连接共用一次序列化"""
+        groups: dict = {}
+        for conn in self.active_connections:
+            channels = self.subscriptions.get(conn)
+            key = frozenset(channels) if channels else None
+            groups.setdefault(key, []).append(conn)
+        
+        ts = time.time()
+        for channels, connections in groups.items():
+            message = {"type": "snapshot", "ts": ts}
+            for name, value in fields.items():
+                if channels is None or name in channels:
+                    message[name] = value
+            await self._send_all(connections, dumps(message))
+    
+    async def _send_all(self, connections: list, payload: str):
+        """并发发送同一份数据"""
+        if not connections:
+            return
+        
+        results = await asyncio.gather(
+            *(asyncio.wait_for(conn.send_text(payload), timeout=SEND_TIMEOUT) for conn in connections),
+            return_exceptions=True
+        )
+        
+        dropped = []
+        for conn, result in zip(connections, results):
+            if isinstance(result, Exception):
+                logger.error(f"发送消息失败: {result!r}")
+                self.disconnect(conn)
+                # 超时以 1013 (Try Again Later)、其他错误以 1011 关闭，让客户端重连而不是停在半开连接上
+                code = 1013 if isinstance(result, asyncio.TimeoutError) else 1011
+                dropped.append(self._close(conn, code))
+        
+        if dropped:
+            await asyncio.gather(*dropped)
+    
+    @staticmethod
+    async def _close(websocket: WebSocket, code: int):
+        """尽力关闭已移除的连接，失败时忽略"""
+        try:
+            await asyncio.wait_for(websocket.close(code=code), timeout=SEND_TIMEOUT)
+        except Exception as e:
+            logger.debug(f"关闭 WebSocket 连接失败: {e!r}")
 
 
 manager = ConnectionManager()
+funding_rates_manager = ConnectionManager()
+positions_manager = ConnectionManager()
 
 
 @router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """WebSocket 主端点"""
-    await manager.connect(websocket)
+    if not await manager.connect(websocket):
+        return
     
     try:
-        # 启动数据推送任务
-        push_task = asyncio.create_task(push_data(websocket))
-        
-        # 等待客户端消息
+        # 等待客户端消息（数据由 broadcast_loop 统一推送）
         while True:
             data = await websocket.receive_text()
             
             # 处理客户端消息
             try:
-                message = json.loads(data)
+                message = loads(data)
                 await handle_client_message(websocket, message)
             except json.JSONDecodeError:
-                await websocket.send_json({
-                    "type": "error",
-                    "message": "Invalid JSON"
-                })
+                await websocket.send_text(INVALID_JSON_MESSAGE)
     
     except WebSocketDisconnect:
         manager.disconnect(websocket)
-        push_task.cancel()
     
     except Exception as e:
         logger.error(f"WebSocket 错误: {e}")
         manager.disconnect(websocket)
 
 
-async def push_data(websocket: WebSocket):
-    """推送实时数据"""
+async def broadcast_loop():
+    """推送实时数据：每个周期只计算一次快照，然后广播给所有连接"""
     try:
         while True:
-            state = get_app_state()
-            
-            # 获取数据
-            collector = state.get('data_collector')
-            manager_pos = state.get('position_manager')
-            
-            if collector and manager_pos:
-                # 推送费率数据
-                rate_diffs = collector.get_all_rate_diffs()
-                await websocket.send_json({
-                    "type": "funding_rates",
-                    "data": rate_diffs
-                })
-                
-                # 推送持仓数据
-                positions = await manager_pos.get_all_positions()
-                await websocket.send_json({
-                    "type": "positions",
-                    "data": positions
-                })
+            try:
+                await push_data()
+            except Exception as e:
+                logger.error(f"推送数据失败: {e}")
             
             # 每5秒推送一次
             await asyncio.sleep(5)
     
     except asyncio.CancelledError:
         pass
-    except Exception as e:
-        logger.error(f"推送数据失败: {e}")
+
+
+async def push_data():
+    """计算一次费率和持仓数据并推送给各端点的连接"""
+    collector = get_collector()
+    manager_pos = get_position_manager()
+    
+    want_rates = manager.active_connections or funding_rates_manager.active_connections
+    want_positions = manager.active_connections or positions_manager.active_connections
+    
+    rate_diffs = collector.get_all_rate_diffs() if collector and want_rates else None
+    positions = await manager_pos.get_all_positions() if manager_pos and want_positions else None
+    
+    if collector and manager_pos and manager.active_connections:
+        # 费率和持仓合并为一帧推送
+        await manager.broadcast_snapshot({
+            "funding_rates": rate_diffs,
+            "positions": positions
+        })
+    
+    if rate_diffs is not None:
+        await funding_rates_manager.broadcast(rate_diffs)
+    
+    if positions is not None:
+        await positions_manager.broadcast(positions)
 
 
 async def handle_client_message(websocket: WebSocket, message: dict):
@@ -112,13 +186,19 @@ async def handle_client_message(websocket: WebSocket, message: dict):
     msg_type = message.get('type')
     
     if msg_type == 'ping':
-        await websocket.send_json({
-            "type": "pong"
-        })
+        await websocket.send_text(PONG_MESSAGE)
     
     elif msg_type == 'subscribe':
         # 处理订阅请求
         channel = message.get('channel')
+        if channel not in SNAPSHOT_CHANNELS:
+            await websocket.send_json({
+                "type": "error",
+                "message": f"Unknown channel: {channel}"
+            })
+            return
+        
+        manager.subscribe(websocket, channel)
         await websocket.send_json({
             "type": "subscribed",
             "channel": channel
@@ -134,38 +214,26 @@ async def handle_client_message(websocket: WebSocket, message: dict):
 @router.websocket("/ws/funding-rates")
 async def websocket_funding_rates(websocket: WebSocket):
     """资金费率实时推送"""
-    await websocket.accept()
+    if not await funding_rates_manager.connect(websocket):
+        return
     
     try:
         while True:
-            state = get_app_state()
-            collector = state.get('data_collector')
-            
-            if collector:
-                rate_diffs = collector.get_all_rate_diffs()
-                await websocket.send_json(rate_diffs)
-            
-            await asyncio.sleep(5)
+            await websocket.receive_text()
     
     except WebSocketDisconnect:
-        pass
+        funding_rates_manager.disconnect(websocket)
 
 
 @router.websocket("/ws/positions")
 async def websocket_positions(websocket: WebSocket):
     """持仓实时推送"""
-    await websocket.accept()
+    if not await positions_manager.connect(websocket):
+        return
     
     try:
         while True:
-            state = get_app_state()
-            manager_pos = state.get('position_manager')
-            
-            if manager_pos:
-                positions = await manager_pos.get_all_positions()
-                await websocket.send_json(positions)
-            
-            await asyncio.sleep(5)
+            await websocket.receive_text()
     
     except WebSocketDisconnect:
-        pass
+        positions_manager.disconnect(websocket)
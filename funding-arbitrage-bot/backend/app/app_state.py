@@ -1,17 +1,84 @@
-
 """
 应用状态管理模块
+
+各核心模块在应用启动时（main.lifespan）赋值为本模块的属性，
+路由通过下面的访问器配合 FastAPI ``Depends`` 获取，避免每次请求都做字典查找。
 """
 
-# 全局状态字典
-app_state = {}
+# 交易所客户端
+lighter_client = None
+binance_client = None
+
+# 核心模块
+data_collector = None
+strategy_engine = None
+order_executor = None
+risk_manager = None
+position_manager = None
+pnl_calculator = None
+
+# 后台任务
+tasks = []
+
+# 核心模块是否已加载（启动后不会变化，由 refresh_modules_snapshot 生成）
+MODULE_NAMES = (
+    'data_collector',
+    'strategy_engine',
+    'order_executor',
+    'risk_manager',
+    'position_manager',
+    'pnl_calculator',
+)
+modules_snapshot = {name: False for name in MODULE_NAMES}
+
+
+def refresh_modules_snapshot():
+    """重新生成模块加载状态快照（模块装配完成或重新加载后调用）"""
+    global modules_snapshot
+    state = globals()
+    modules_snapshot = {name: state[name] is not None for name in MODULE_NAMES}
+
+
+def get_lighter():
+    """获取 Lighter 客户端"""
+    return lighter_client
+
+
+def get_binance():
+    """获取币安客户端"""
+    return binance_client
+
+
+def get_collector():
+    """获取数据采集器"""
+    return data_collector
+
+
+def get_engine():
+    """获取策略引擎"""
+    return strategy_engine
+
+
+def get_executor():
+    """获取订单执行器"""
+    return order_executor
+
+
+def get_risk_manager():
+    """获取风险管理器"""
+    return risk_manager
+
+
+def get_position_manager():
+    """获取持仓管理器"""
+    return position_manager
 
 
-def get_app_state():
-    """获取应用状态"""
-    return app_state
+def get_pnl_calculator():
+    """获取盈亏计算器"""
+    return pnl_calculator
 
 
-def set_app_state(key, value):
-    """设置应用状态"""
-    app_state[key] = value
+def get_modules_snapshot():
+    """获取模块加载状态快照"""
+    return modules_snapshot
@@ -1,39 +1,47 @@
 import logging
 import asyncio
 import time
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 from decimal import Decimal
 from datetime import datetime, timedelta
 
 logger = logging.getLogger(__name__)
 
+_NAN = float('nan')
+
 
 class DataCollector:
     """数据采集器 - 负责采集和管理费率数据"""
     
-    def __init__(self):
-        self.lighter_client = None
-        self.binance_client = None
+    def __init__(self, lighter_client=None, binance_client=None):
+        # 复用应用级的交易所客户端，避免重复建立连接
+        self.lighter_client = lighter_client
+        self.binance_client = binance_client
         self.running = False
         
-        # 存储费率数据
-        self.funding_rates = {
-            'lighter': {},  # {symbol: {'rate': float, 'timestamp': int}}
-            'binance': {}
-        }
+        # 存储费率数据（按列存储：同一下标对应同一交易对，缺失记为 NaN）
+        self._symbol_index: Dict[str, int] = {}
+        self._symbols: List[str] = []
+        self._lighter: List[float] = []
+        self._binance: List[float] = []
+        self.last_collected_at = 0
+        
+        # 费率差快照，每次采集后重新计算
+        self._rate_diffs: Dict[str, Dict] = {}
         
         logger.info("数据采集器初始化")
     
     async def initialize(self):
-        """初始化采集器"""
-        from ..exchanges.lighter_client import LighterClient
-        from ..exchanges.binance_client import BinanceClient
-        
-        self.lighter_client = LighterClient()
-        self.binance_client = BinanceClient()
+        """初始化采集器（仅在未传入客户端时自行创建）"""
+        if self.lighter_client is None:
+            from ..exchanges.lighter_client import LighterClient
+            self.lighter_client = LighterClient()
+            await self.lighter_client.initialize()
         
-        await self.lighter_client.initialize()
-        await self.binance_client.initialize()
+        if self.binance_client is None:
+            from ..exchanges.binance_client import BinanceClient
+            self.binance_client = BinanceClient()
+            await self.binance_client.initialize()
         
         logger.info("数据采集器初始化成功")
     
@@ -88,79 +96,61 @@ class DataCollector:
             # 保存数据
             timestamp = int(time.time())
             
-            # 获取所有交易对
-            all_symbols = set(list(lighter_rates.keys()) + list(binance_rates.keys()))
+            for symbol, rate in lighter_rates.items():
+                self._lighter[self._slot(symbol)] = float(rate)
             
-            for symbol in all_symbols:
-                lighter_rate = lighter_rates.get(symbol)
-                binance_rate = binance_rates.get(symbol)
-                
-                if lighter_rate is not None:
-                    self.funding_rates['lighter'][symbol] = {
-                        'rate': float(lighter_rate),
-                        'timestamp': timestamp
-                    }
-                
-                if binance_rate is not None:
-                    self.funding_rates['binance'][symbol] = {
-                        'rate': float(binance_rate),
-                        'timestamp': timestamp
-                    }
+            for symbol, rate in binance_rates.items():
+                self._binance[self._slot(symbol)] = float(rate)
+            
+            self.last_collected_at = timestamp
+            
+            # 每个采集周期计算一次费率差
+            self._rebuild_rate_diffs()
             
             logger.info(f"费率采集完成: Lighter {len(lighter_rates)}, 币安 {len(binance_rates)}")
             
         except Exception as e:
-            logger.error(f"采集资金费率失败: {e}")
-            import traceback
-            logger.error(traceback.format_exc())
+            logger.exception(f"采集资金费率失败: {e}")
     
-    def get_rate_diff(self, symbol: str) -> Optional[Dict]:
-        """获取指定交易对的费率差"""
-        try:
-            lighter_data = self.funding_rates['lighter'].get(symbol)
-            binance_data = self.funding_rates['binance'].get(symbol)
-            
-            if not lighter_data or not binance_data:
-                return None
-            
-            lighter_rate = lighter_data['rate']
-            binance_rate = binance_data['rate']
+    def _slot(self, symbol: str) -> int:
+        """获取交易对所在下标，新交易对追加到末尾"""
+        idx = self._symbol_index.get(symbol)
+        if idx is None:
+            idx = len(self._symbols)
+            self._symbol_index[symbol] = idx
+            self._symbols.append(symbol)
+            self._lighter.append(_NAN)
+            self._binance.append(_NAN)
+        return idx
+    
+    def _rebuild_rate_diffs(self):
+        """根据最新费率重建费率差快照"""
+        diffs = {}
+        for symbol, lighter_rate, binance_rate in zip(self._symbols, self._lighter, self._binance):
+            # 任一交易所缺失费率（NaN != NaN）则跳过
+            if lighter_rate != lighter_rate or binance_rate != binance_rate:
+                continue
             
             # 计算费率差 (Lighter - 币安)
             current_diff = lighter_rate - binance_rate
             
-            # 简化：8小时平均差 = 当前差 (实际应该查历史数据)
-            avg_8h_diff = current_diff
-            
-            # 获取价格（从币安）
-            price = 0.0
-            
-            return {
+            diffs[symbol] = {
                 'symbol': symbol,
                 'lighter_rate': lighter_rate,
                 'binance_rate': binance_rate,
                 'current_diff': current_diff,
-                'avg_8h_diff': avg_8h_diff,
-                'price': price
+                # 简化：8小时平均差 = 当前差 (实际应该查历史数据)
+                'avg_8h_diff': current_diff,
+                # 获取价格（从币安）
+                'price': 0.0
             }
-            
-        except Exception as e:
-            logger.error(f"计算费率差失败 {symbol}: {e}")
-            return None
+        
+        self._rate_diffs = diffs
+    
+    def get_rate_diff(self, symbol: str) -> Optional[Dict]:
+        """获取指定交易对的费率差"""
+        return self._rate_diffs.get(symbol)
     
     def get_all_rate_diffs(self) -> Dict[str, Dict]:
         """获取所有交易对的费率差"""
-        rate_diffs = {}
-        
-        # 获取所有交易对
-        all_symbols = set(
-            list(self.funding_rates['lighter'].keys()) +
-            list(self.funding_rates['binance'].keys())
-        )
-        
-        for symbol in all_symbols:
-            diff = self.get_rate_diff(symbol)
-            if diff:
-                rate_diffs[symbol] = diff
-        
-        return rate_diffs
+        return self._rate_diffs
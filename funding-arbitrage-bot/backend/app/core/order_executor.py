@@ -1,18 +1,55 @@
 import logging
 import asyncio
+from dataclasses import dataclass
 from typing import Dict, Optional, List
 from decimal import Decimal
-from datetime import datetime
+from sqlalchemy import func, insert, select, update
 from sqlalchemy.orm import Session
 from ..exchanges.lighter_client import LighterClient
 from ..exchanges.binance_client import BinanceClient
 from ..models import ArbitrageOrder, Trade
 from ..database import get_db_context
-import json
-import uuid
+from ..config import settings
+from ..utils.token_bucket import TokenBucket
+import os
+import time
 
 logger = logging.getLogger(__name__)
 
+# 成交记录批量写入：单批最多条数 / 凑批最长等待时间（秒）
+TRADE_BATCH_SIZE = 64
+TRADE_FLUSH_INTERVAL = 0.2
+
+# 下单延迟 EWMA 平滑系数，以及为对齐两边到达时间最多推迟的秒数
+LATENCY_EWMA_ALPHA = 0.2
+MAX_LEG_DELAY = 1.0
+
+# 连续未成交（或持续不平衡）的最大重试次数，以及退避等待上限（秒）
+MAX_CONSECUTIVE_FAILURES = 5
+MAX_RETRY_BACKOFF = 30.0
+
+# 币安订单已成交的状态值
+BINANCE_FILLED_STATUSES = frozenset(('FILLED', 'filled'))
+
+
+def _to_decimal(value) -> Decimal:
+    """交易所返回值转 Decimal，已是 Decimal 时直接返回"""
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+async def _no_order() -> None:
+    """占位：本批不在该交易所下单"""
+    return None
+
+
+@dataclass(slots=True)
+class ActiveOrder:
+    """本进程建仓中/已建仓订单的轻量缓存，只保留平仓需要的字段"""
+    pk: int
+    symbol: str
+    lighter_side: str
+    binance_side: str
+
 
 class OrderExecutor:
     """订单执行器 - 处理建仓和平仓"""
@@ -20,7 +57,61 @@ class OrderExecutor:
     def __init__(self, lighter_client: LighterClient, binance_client: BinanceClient):
         self.lighter = lighter_client
         self.binance = binance_client
-        self.active_orders: Dict[str, ArbitrageOrder] = {}
+        self.active_orders: Dict[str, ActiveOrder] = {}
+        # 风险管理器（由 main 装配后设置），建仓/平仓时同步其止损止盈监控列表
+        self.risk_manager = None
+        # 任一交易所有成交时置位，用于唤醒等待成交的循环
+        self._fill_event = asyncio.Event()
+        # 成交记录队列，由 start() 中的后台写入循环批量落库
+        self._trade_queue: asyncio.Queue = asyncio.Queue()
+        self.running = False
+        # 两边下单接口的平均延迟（秒，EWMA），用于让两笔订单尽量同时到达
+        self.lighter_latency = 0.0
+        self.binance_latency = 0.0
+        # 按交易所限速下单，替代每批固定 sleep
+        self.lighter_bucket = TokenBucket(
+            settings.lighter_orders_per_second, settings.lighter_orders_per_second
+        )
+        self.binance_bucket = TokenBucket(
+            settings.binance_orders_per_second, settings.binance_orders_per_second
+        )
+    
+    async def start(self):
+        """启动成交记录写入循环"""
+        self.running = True
+        logger.info("订单执行器启动")
+        
+        while self.running:
+            try:
+                batch = await self._next_trade_batch()
+                if batch:
+                    await self._write_trades(batch)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"成交记录写入循环错误: {e}")
+    
+    async def stop(self):
+        """停止写入循环并落库剩余成交记录"""
+        self.running = False
+        await self.flush_trades()
+        logger.info("订单执行器停止")
+    
+    async def prewarm(self):
+        """启动时预热两个交易所的 HTTP 连接，避免第一批订单承担 DNS/TLS 握手延迟"""
+        lighter_ok, binance_ok = await asyncio.gather(
+            self.lighter.ping(), self.binance.ping()
+        )
+        logger.info(f"交易所连接预热: Lighter {'✅' if lighter_ok else '❌'}, 币安 {'✅' if binance_ok else '❌'}")
+    
+    async def flush_trades(self):
+        """立即写入队列中的成交记录，并等待后台正在写入的批次完成"""
+        batch = []
+        while not self._trade_queue.empty():
+            batch.append(self._trade_queue.get_nowait())
+        if batch:
+            await self._write_trades(batch)
+        await self._trade_queue.join()
     
     async def execute_open_position(
         self,
@@ -53,161 +144,284 @@ class OrderExecutor:
         Returns:
             订单ID 或 None
         """
-        order_id = f"ARB_{symbol}_{int(datetime.now().timestamp())}_{uuid.uuid4().hex[:8]}"
+        order_id = f"ARB_{symbol}_{time.time_ns() // 1_000_000_000}_{os.urandom(4).hex()}"
         
         logger.info(f"开始建仓: {order_id}")
         logger.info(f"  交易对: {symbol}")
         logger.info(f"  Lighter: {lighter_side}, 币安: {binance_side}")
         logger.info(f"  目标金额: {target_amount} USDC")
         
+        # 订单主键，写入后缓存，后续更新按主键定位
+        pk = None
+        # 两边累计成交金额，中途失败时据此处理已有敞口
+        lighter_filled = Decimal('0')
+        binance_filled = Decimal('0')
+        
         try:
             # 创建订单记录
-            with get_db_context() as db:
-                order = ArbitrageOrder(
-                    order_id=order_id,
-                    symbol=symbol,
-                    strategy_type=strategy_type,
-                    lighter_side=lighter_side,
-                    lighter_entry_amount=target_amount,
-                    lighter_filled_amount=Decimal('0'),
-                    lighter_leverage=leverage,
-                    lighter_order_ids='[]',
-                    binance_side=binance_side,
-                    binance_entry_amount=target_amount,
-                    binance_filled_amount=Decimal('0'),
-                    binance_leverage=leverage,
-                    binance_order_ids='[]',
-                    status='opening',
-                    imbalance_amount=Decimal('0'),
-                    stop_loss_price=stop_loss_price,
-                    take_profit_price=take_profit_price
-                )
-                db.add(order)
+            order = ArbitrageOrder(
+                order_id=order_id,
+                symbol=symbol,
+                strategy_type=strategy_type,
+                lighter_side=lighter_side,
+                lighter_entry_amount=target_amount,
+                lighter_filled_amount=Decimal('0'),
+                lighter_leverage=leverage,
+                lighter_order_ids=[],
+                binance_side=binance_side,
+                binance_entry_amount=target_amount,
+                binance_filled_amount=Decimal('0'),
+                binance_leverage=leverage,
+                binance_order_ids=[],
+                status='opening',
+                imbalance_amount=Decimal('0'),
+                stop_loss_price=stop_loss_price,
+                take_profit_price=take_profit_price
+            )
+            pk = await asyncio.to_thread(self._insert_order, order)
             
             # 分批建仓
-            lighter_filled = Decimal('0')
-            binance_filled = Decimal('0')
             lighter_order_ids = []
             binance_order_ids = []
+            failures = 0
+            # 当前不平衡金额，只在有新成交时重新计算
+            imbalance = Decimal('0')
             
             while lighter_filled < target_amount or binance_filled < target_amount:
-                # 检查不平衡
-                imbalance = abs(lighter_filled - binance_filled)
                 if imbalance > max_imbalance:
-                    logger.warning(f"持仓不平衡 {imbalance} USDC，等待成交...")
-                    await asyncio.sleep(5)
-                    continue
-                
-                # 计算本次下单金额
-                lighter_remaining = target_amount - lighter_filled
-                binance_remaining = target_amount - binance_filled
-                
-                current_amount = min(amount_per_order, lighter_remaining, binance_remaining)
-                
-                if current_amount <= 0:
-                    break
-                
-                logger.info(f"分批建仓: {current_amount} USDC")
+                    # 不平衡超限：只在落后的一边补单，补齐差额后再继续分批
+                    logger.warning("持仓不平衡 %s USDC，补单落后的一边", imbalance)
+                    top_up = min(amount_per_order, imbalance)
+                    lighter_amount = top_up if lighter_filled < binance_filled else Decimal('0')
+                    binance_amount = top_up if binance_filled < lighter_filled else Decimal('0')
+                    lighter_delay = binance_delay = 0.0
+                else:
+                    # 计算本次下单金额
+                    lighter_remaining = target_amount - lighter_filled
+                    binance_remaining = target_amount - binance_filled
+                    
+                    current_amount = min(amount_per_order, lighter_remaining, binance_remaining)
+                    
+                    if current_amount <= 0:
+                        break
+                    
+                    logger.debug("分批建仓: %s USDC", current_amount)
+                    lighter_amount = binance_amount = current_amount
+                    lighter_delay, binance_delay = self._leg_delays()
                 
-                # 同时在两个平台下单
+                # 同时在两个平台下单（金额为 0 的一边不下单）
                 lighter_task = self._place_lighter_order(
-                    symbol, lighter_side, current_amount, leverage
-                )
+                    symbol, lighter_side, lighter_amount, leverage, lighter_delay
+                ) if lighter_amount > 0 else _no_order()
                 binance_task = self._place_binance_order(
-                    symbol, binance_side, current_amount, leverage
-                )
+                    symbol, binance_side, binance_amount, leverage, binance_delay
+                ) if binance_amount > 0 else _no_order()
                 
                 lighter_result, binance_result = await asyncio.gather(
                     lighter_task, binance_task, return_exceptions=True
                 )
+                # 本批成交时间（毫秒），两边成交记录共用
+                ts_ms = time.time_ns() // 1_000_000
+                # 本批需要写回订单的字段，只序列化有新成交的一边
+                changes = {}
                 
                 # 处理 Lighter 订单结果
                 if isinstance(lighter_result, dict) and lighter_result.get('status') == 'filled':
-                    lighter_filled += Decimal(str(lighter_result['filled_amount']))
+                    lighter_fill = _to_decimal(lighter_result['filled_amount'])
+                    lighter_filled += lighter_fill
                     lighter_order_ids.append(lighter_result['order_id'])
+                    changes['lighter_order_ids'] = list(lighter_order_ids)
                     
                     # 记录成交
                     self._record_trade(
                         order_id, 'lighter', symbol, lighter_side, 'open',
-                        Decimal(str(lighter_result['price'])),
-                        Decimal(str(lighter_result['filled_amount'])),
-                        lighter_result['order_id']
+                        _to_decimal(lighter_result['price']),
+                        lighter_fill,
+                        lighter_result['order_id'],
+                        ts_ms
                     )
-                else:
+                elif lighter_amount > 0:
                     logger.error(f"Lighter 下单失败: {lighter_result}")
                 
                 # 处理币安订单结果
-                if isinstance(binance_result, dict) and binance_result.get('status') in ['FILLED', 'filled']:
-                    binance_filled += Decimal(str(binance_result['filled_amount']))
+                if isinstance(binance_result, dict) and binance_result.get('status') in BINANCE_FILLED_STATUSES:
+                    binance_fill = _to_decimal(binance_result['filled_amount'])
+                    binance_filled += binance_fill
                     binance_order_ids.append(binance_result['order_id'])
+                    changes['binance_order_ids'] = list(binance_order_ids)
                     
                     # 记录成交
                     self._record_trade(
                         order_id, 'binance', symbol, binance_side, 'open',
-                        Decimal(str(binance_result['price'])),
-                        Decimal(str(binance_result['filled_amount'])),
-                        binance_result['order_id']
+                        _to_decimal(binance_result['price']),
+                        binance_fill,
+                        binance_result['order_id'],
+                        ts_ms
                     )
-                else:
+                elif binance_amount > 0:
                     logger.error(f"币安下单失败: {binance_result}")
                 
-                # 更新订单状态
-                with get_db_context() as db:
-                    order = db.query(ArbitrageOrder).filter(
-                        ArbitrageOrder.order_id == order_id
-                    ).first()
-                    if order:
-                        order.lighter_filled_amount = lighter_filled
-                        order.binance_filled_amount = binance_filled
-                        order.imbalance_amount = abs(lighter_filled - binance_filled)
-                        order.lighter_order_ids = json.dumps(lighter_order_ids)
-                        order.binance_order_ids = json.dumps(binance_order_ids)
+                # 没有任何成交时退避重试，连续失败过多则放弃
+                if not changes:
+                    failures += 1
+                    await self._retry_backoff(failures)
+                    continue
+                failures = 0
+                imbalance = abs(lighter_filled - binance_filled)
                 
-                logger.info(f"进度: Lighter {lighter_filled}/{target_amount}, 币安 {binance_filled}/{target_amount}")
+                # 更新订单状态
+                await asyncio.to_thread(
+                    self._update_order,
+                    pk,
+                    lighter_filled_amount=lighter_filled,
+                    binance_filled_amount=binance_filled,
+                    imbalance_amount=imbalance,
+                    **changes
+                )
                 
-                # 避免频繁下单
-                await asyncio.sleep(2)
+                logger.debug(
+                    "进度: Lighter %s/%s, 币安 %s/%s",
+                    lighter_filled, target_amount, binance_filled, target_amount
+                )
             
             # 建仓完成，设置止损止盈
             logger.info("建仓完成，设置止损止盈...")
-            await self._set_stop_loss_take_profit(
-                symbol, lighter_side, binance_side,
+            await self._finish_open(
+                order_id, pk, symbol, lighter_side, binance_side,
                 stop_loss_price, take_profit_price
             )
-            
-            # 更新订单状态为 open
-            with get_db_context() as db:
-                order = db.query(ArbitrageOrder).filter(
-                    ArbitrageOrder.order_id == order_id
-                ).first()
-                if order:
-                    order.status = 'open'
-                    order.lighter_entry_price = await self._get_avg_entry_price(
-                        order_id, 'lighter'
-                    )
-                    order.binance_entry_price = await self._get_avg_entry_price(
-                        order_id, 'binance'
-                    )
-            
-            self.active_orders[order_id] = order
             logger.info(f"✅ 建仓成功: {order_id}")
             return order_id
         
         except Exception as e:
-            logger.error(f"建仓失败: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"建仓失败 {order_id}: {e}")
             
-            # 更新订单状态为失败
-            with get_db_context() as db:
-                order = db.query(ArbitrageOrder).filter(
-                    ArbitrageOrder.order_id == order_id
-                ).first()
-                if order:
-                    order.status = 'failed'
+            if pk is not None:
+                await self._abort_open(
+                    order_id, pk, symbol, lighter_side, binance_side,
+                    lighter_filled, binance_filled,
+                    stop_loss_price, take_profit_price
+                )
             
             return None
     
+    async def _finish_open(
+        self,
+        order_id: str,
+        pk: int,
+        symbol: str,
+        lighter_side: str,
+        binance_side: str,
+        stop_loss_price: Decimal,
+        take_profit_price: Decimal
+    ):
+        """设置止损止盈、按成交记录写入开仓均价并将订单置为 open，加入平仓缓存和风控监控"""
+        # 计算开仓均价前确保成交记录已落库
+        await self.flush_trades()
+        
+        await self._set_stop_loss_take_profit(
+            symbol, lighter_side, binance_side,
+            stop_loss_price, take_profit_price
+        )
+        
+        # 更新订单状态为 open
+        lighter_entry_price, binance_entry_price = await asyncio.gather(
+            self._get_avg_entry_price(order_id, 'lighter'),
+            self._get_avg_entry_price(order_id, 'binance')
+        )
+        await asyncio.to_thread(
+            self._update_order,
+            pk,
+            status='open',
+            lighter_entry_price=lighter_entry_price,
+            binance_entry_price=binance_entry_price
+        )
+        
+        self.active_orders[order_id] = ActiveOrder(pk, symbol, lighter_side, binance_side)
+        if self.risk_manager is not None:
+            self.risk_manager.register_order(
+                order_id, symbol, lighter_side, stop_loss_price, take_profit_price
+            )
+    
+    async def _abort_open(
+        self,
+        order_id: str,
+        pk: int,
+        symbol: str,
+        lighter_side: str,
+        binance_side: str,
+        lighter_filled: Decimal,
+        binance_filled: Decimal,
+        stop_loss_price: Decimal,
+        take_profit_price: Decimal
+    ):
+        """
+        建仓中途失败的收尾：先平掉领先一边多出的部分，再按实际成交记录敞口
+        
+        两边都没有成交时订单置为 failed；否则订单以实际成交金额置为 open，
+        仍在止损止盈监控中，可以正常平仓
+        """
+        try:
+            excess = lighter_filled - binance_filled
+            if excess != 0:
+                # 反向下单平掉领先一边的多余部分（与平仓一致，使用 1 倍杠杆）
+                ts_ms = time.time_ns() // 1_000_000
+                if excess > 0:
+                    close_side = 'short' if lighter_side == 'long' else 'long'
+                    result = await self._place_lighter_order(symbol, close_side, excess, 1)
+                    if result.get('status') == 'filled':
+                        fill = _to_decimal(result['filled_amount'])
+                        lighter_filled -= fill
+                        self._record_trade(
+                            order_id, 'lighter', symbol, close_side, 'close',
+                            _to_decimal(result['price']), fill, result['order_id'], ts_ms
+                        )
+                else:
+                    close_side = 'short' if binance_side == 'long' else 'long'
+                    result = await self._place_binance_order(symbol, close_side, -excess, 1)
+                    if result.get('status') in BINANCE_FILLED_STATUSES:
+                        fill = _to_decimal(result['filled_amount'])
+                        binance_filled -= fill
+                        self._record_trade(
+                            order_id, 'binance', symbol, close_side, 'close',
+                            _to_decimal(result['price']), fill, result['order_id'], ts_ms
+                        )
+            
+            # 建仓金额同步改为实际成交金额，盈亏和风控按实际敞口计算
+            imbalance = abs(lighter_filled - binance_filled)
+            await asyncio.to_thread(
+                self._update_order,
+                pk,
+                lighter_entry_amount=lighter_filled,
+                binance_entry_amount=binance_filled,
+                lighter_filled_amount=lighter_filled,
+                binance_filled_amount=binance_filled,
+                imbalance_amount=imbalance
+            )
+            
+            if lighter_filled <= 0 and binance_filled <= 0:
+                await self.flush_trades()
+                await asyncio.to_thread(self._update_order, pk, status='failed')
+                return
+            
+            if imbalance > 0:
+                logger.error(
+                    f"建仓失败 {order_id} 仍有单边敞口 {imbalance} USDC "
+                    f"(Lighter {lighter_filled}, 币安 {binance_filled})，需人工处理"
+                )
+            else:
+                logger.warning(f"建仓未完成 {order_id}，已成交部分以 {lighter_filled} USDC 保留")
+            await self._finish_open(
+                order_id, pk, symbol, lighter_side, binance_side,
+                stop_loss_price, take_profit_price
+            )
+        except Exception as e:
+            logger.exception(f"建仓失败后处理敞口出错 {order_id}: {e}")
+            try:
+                await asyncio.to_thread(self._update_order, pk, status='failed')
+            except Exception as update_error:
+                logger.error(f"更新订单状态失败 {order_id}: {update_error}")
+    
     async def execute_close_position(
         self,
         order_id: str,
@@ -225,92 +439,110 @@ class OrderExecutor:
         """
         logger.info(f"开始平仓: {order_id}")
         
+        # 已标记为 closing 的订单主键，平仓中途失败时据此恢复为 open
+        pk = None
+        
         try:
-            # 获取订单信息
-            with get_db_context() as db:
-                order = db.query(ArbitrageOrder).filter(
-                    ArbitrageOrder.order_id == order_id
-                ).first()
-                
-                if not order:
-                    logger.error(f"订单不存在: {order_id}")
-                    return False
-                
-                if order.status != 'open':
-                    logger.error(f"订单状态不是 open: {order.status}")
-                    return False
-                
-                # 更新状态为 closing
-                order.status = 'closing'
+            # 获取订单信息并标记为 closing：本进程建仓的订单直接用缓存，只需一条条件 UPDATE
+            cached = self.active_orders.get(order_id)
+            if cached is not None and await asyncio.to_thread(self._mark_closing, cached.pk):
+                order_info = (cached.pk, cached.symbol, cached.lighter_side, cached.binance_side)
+            else:
+                order_info = await asyncio.to_thread(self._begin_close, order_id)
+            if not order_info:
+                return False
             
-            symbol = order.symbol
-            lighter_side = order.lighter_side
-            binance_side = order.binance_side
+            pk, symbol, lighter_side, binance_side = order_info
             
-            # 获取当前持仓
-            lighter_position = await self.lighter.get_position(symbol)
-            binance_position = await self.binance.get_position(symbol)
+            # 已进入 closing 状态，不再参与止损止盈监控
+            if self.risk_manager is not None:
+                self.risk_manager.unregister_order(order_id)
+            
+            # 获取当前持仓（任一边查询失败时无法确定平仓数量，恢复为 open 等待重试）
+            lighter_position, binance_position = await asyncio.gather(
+                self.lighter.get_position(symbol),
+                self.binance.get_position(symbol),
+                return_exceptions=True
+            )
+            if isinstance(lighter_position, Exception) or isinstance(binance_position, Exception):
+                logger.error(f"获取持仓失败 {order_id}: Lighter {lighter_position!r}, 币安 {binance_position!r}")
+                await self._restore_open(order_id, pk)
+                return False
             
             lighter_amount = Decimal(str(lighter_position.get('amount', 0))) if lighter_position else Decimal('0')
             binance_amount = Decimal(str(binance_position.get('amount', 0))) if binance_position else Decimal('0')
             
             logger.info(f"当前持仓: Lighter {lighter_amount}, 币安 {binance_amount}")
             
+            # 平仓方向与开仓相反
+            lighter_close_side = 'short' if lighter_side == 'long' else 'long'
+            binance_close_side = 'short' if binance_side == 'long' else 'long'
+            
             # 分批平仓
+            failures = 0
             while lighter_amount > 0 or binance_amount > 0:
                 current_amount = min(amount_per_order, lighter_amount, binance_amount)
                 
                 if current_amount <= 0:
                     break
                 
-                logger.info(f"分批平仓: {current_amount}")
-                
-                # 平仓方向与开仓相反
-                lighter_close_side = 'short' if lighter_side == 'long' else 'long'
-                binance_close_side = 'short' if binance_side == 'long' else 'long'
+                logger.debug("分批平仓: %s", current_amount)
                 
                 # 同时平仓
+                lighter_delay, binance_delay = self._leg_delays()
                 lighter_task = self._place_lighter_order(
-                    symbol, lighter_close_side, current_amount, 1
+                    symbol, lighter_close_side, current_amount, 1, lighter_delay
                 )
                 binance_task = self._place_binance_order(
-                    symbol, binance_close_side, current_amount, 1
+                    symbol, binance_close_side, current_amount, 1, binance_delay
                 )
                 
                 lighter_result, binance_result = await asyncio.gather(
                     lighter_task, binance_task, return_exceptions=True
                 )
+                # 本批成交时间（毫秒），两边成交记录共用
+                ts_ms = time.time_ns() // 1_000_000
                 
                 # 处理结果并记录
+                filled_any = False
                 if isinstance(lighter_result, dict) and lighter_result.get('status') == 'filled':
-                    lighter_amount -= Decimal(str(lighter_result['filled_amount']))
+                    lighter_fill = _to_decimal(lighter_result['filled_amount'])
+                    lighter_amount -= lighter_fill
+                    filled_any = True
                     self._record_trade(
                         order_id, 'lighter', symbol, lighter_close_side, 'close',
-                        Decimal(str(lighter_result['price'])),
-                        Decimal(str(lighter_result['filled_amount'])),
-                        lighter_result['order_id']
+                        _to_decimal(lighter_result['price']),
+                        lighter_fill,
+                        lighter_result['order_id'],
+                        ts_ms
                     )
                 
-                if isinstance(binance_result, dict) and binance_result.get('status') in ['FILLED', 'filled']:
-                    binance_amount -= Decimal(str(binance_result['filled_amount']))
+                if isinstance(binance_result, dict) and binance_result.get('status') in BINANCE_FILLED_STATUSES:
+                    binance_fill = _to_decimal(binance_result['filled_amount'])
+                    binance_amount -= binance_fill
+                    filled_any = True
                     self._record_trade(
                         order_id, 'binance', symbol, binance_close_side, 'close',
-                        Decimal(str(binance_result['price'])),
-                        Decimal(str(binance_result['filled_amount'])),
-                        binance_result['order_id']
+                        _to_decimal(binance_result['price']),
+                        binance_fill,
+                        binance_result['order_id'],
+                        ts_ms
                     )
                 
-                logger.info(f"剩余持仓: Lighter {lighter_amount}, 币安 {binance_amount}")
+                logger.debug("剩余持仓: Lighter %s, 币安 %s", lighter_amount, binance_amount)
                 
-                await asyncio.sleep(2)
+                # 两边都没有成交时退避重试，连续失败过多则放弃
+                if filled_any:
+                    failures = 0
+                else:
+                    failures += 1
+                    await self._retry_backoff(failures)
+            
+            # 平仓成交记录先落库，调用方随后按成交记录计算盈亏
+            await self.flush_trades()
             
             # 更新订单状态为 closed
-            with get_db_context() as db:
-                order = db.query(ArbitrageOrder).filter(
-                    ArbitrageOrder.order_id == order_id
-                ).first()
-                if order:
-                    order.status = 'closed'
+            await asyncio.to_thread(self._update_order, pk, status='closed')
             
             if order_id in self.active_orders:
                 del self.active_orders[order_id]
@@ -319,20 +551,43 @@ class OrderExecutor:
             return True
         
         except Exception as e:
-            logger.error(f"平仓失败: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"平仓失败 {order_id}: {e}")
+            if pk is not None:
+                await self._restore_open(order_id, pk)
             return False
     
+    async def _restore_open(self, order_id: str, pk: int):
+        """平仓未完成：订单恢复为 open 并重新加入止损止盈监控，可以再次平仓"""
+        try:
+            row = await asyncio.to_thread(self._reopen, pk)
+        except Exception as e:
+            logger.error(f"恢复订单状态失败 {order_id}: {e}")
+            return
+        if row is None:
+            return
+        
+        symbol, lighter_side, stop_loss_price, take_profit_price = row
+        if self.risk_manager is not None:
+            self.risk_manager.register_order(
+                order_id, symbol, lighter_side, stop_loss_price, take_profit_price
+            )
+        logger.warning(f"订单已恢复为 open: {order_id}")
+    
     async def _place_lighter_order(
         self,
         symbol: str,
         side: str,
         amount: Decimal,
-        leverage: int
+        leverage: int,
+        delay: float = 0.0
     ) -> Dict:
-        """在 Lighter 下单"""
+        """在 Lighter 下单，delay 为发送前等待的秒数"""
         try:
+            await self.lighter_bucket.acquire()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            
+            started = time.monotonic()
             result = await self.lighter.create_order(
                 symbol=symbol,
                 side=side,
@@ -340,6 +595,9 @@ class OrderExecutor:
                 order_type='market',
                 leverage=leverage
             )
+            self.lighter_latency = self._ewma(self.lighter_latency, time.monotonic() - started)
+            if result and result.get('status') == 'filled':
+                self._fill_event.set()
             return result or {}
         except Exception as e:
             logger.error(f"Lighter 下单异常: {e}")
@@ -350,10 +608,16 @@ class OrderExecutor:
         symbol: str,
         side: str,
         amount: Decimal,
-        leverage: int
+        leverage: int,
+        delay: float = 0.0
     ) -> Dict:
-        """在币安下单"""
+        """在币安下单，delay 为发送前等待的秒数"""
         try:
+            await self.binance_bucket.acquire()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            
+            started = time.monotonic()
             result = await self.binance.create_order(
                 symbol=symbol,
                 side=side,
@@ -361,11 +625,156 @@ class OrderExecutor:
                 order_type='MARKET',
                 leverage=leverage
             )
+            self.binance_latency = self._ewma(self.binance_latency, time.monotonic() - started)
+            if result and result.get('status') in BINANCE_FILLED_STATUSES:
+                self._fill_event.set()
             return result or {}
         except Exception as e:
             logger.error(f"币安下单异常: {e}")
             return {'status': 'error', 'message': str(e)}
     
+    @staticmethod
+    def _ewma(previous: float, sample: float) -> float:
+        """更新延迟 EWMA，首个样本直接作为初值"""
+        if previous <= 0:
+            return sample
+        return previous + LATENCY_EWMA_ALPHA * (sample - previous)
+    
+    def _leg_delays(self) -> tuple:
+        """
+        计算两边的发送延迟：延迟较低的一边推迟发送，使两笔订单大致同时到达交易所，
+        减少单边先成交导致的不平衡
+        
+        Returns:
+            (lighter_delay, binance_delay)
+        """
+        diff = self.binance_latency - self.lighter_latency
+        if diff > 0:
+            return min(diff, MAX_LEG_DELAY), 0.0
+        return 0.0, min(-diff, MAX_LEG_DELAY)
+    
+    async def _retry_backoff(self, failures: int):
+        """指数退避等待（期间有成交会提前唤醒），连续失败超过上限时抛出异常终止分批循环"""
+        if failures > MAX_CONSECUTIVE_FAILURES:
+            raise RuntimeError(f"连续 {MAX_CONSECUTIVE_FAILURES} 次未能推进成交，终止执行")
+        await self._wait_for_fill(min(MAX_RETRY_BACKOFF, 0.5 * 2 ** failures))
+    
+    async def _wait_for_fill(self, timeout: float):
+        """等待之后发生的成交通知，超时后返回（先清除之前的成交留下的置位）"""
+        self._fill_event.clear()
+        try:
+            await asyncio.wait_for(self._fill_event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+    
+    def _insert_order(self, order: ArbitrageOrder) -> int:
+        """写入新订单，返回主键"""
+        with get_db_context() as db:
+            db.add(order)
+            db.flush()
+            return order.id
+    
+    def _begin_close(self, order_id: str) -> Optional[tuple]:
+        """
+        校验订单可平仓并将状态更新为 closing
+        
+        Returns:
+            (主键, symbol, lighter_side, binance_side)，订单不存在或状态不是 open 时返回 None
+        """
+        with get_db_context() as db:
+            order = db.query(ArbitrageOrder).filter(
+                ArbitrageOrder.order_id == order_id
+            ).first()
+            
+            if not order:
+                logger.error(f"订单不存在: {order_id}")
+                return None
+            
+            if order.status != 'open':
+                logger.error(f"订单状态不是 open: {order.status}")
+                return None
+            
+            # 更新状态为 closing
+            order.status = 'closing'
+            return order.id, order.symbol, order.lighter_side, order.binance_side
+    
+    def _mark_closing(self, pk: int) -> bool:
+        """仅当订单仍为 open 时更新为 closing，返回是否更新成功"""
+        with get_db_context() as db:
+            result = db.execute(
+                update(ArbitrageOrder)
+                .where(ArbitrageOrder.id == pk, ArbitrageOrder.status == 'open')
+                .values(status='closing')
+            )
+            return result.rowcount == 1
+    
+    def _reopen(self, pk: int) -> Optional[tuple]:
+        """
+        将 closing 状态的订单恢复为 open
+        
+        Returns:
+            (symbol, lighter_side, stop_loss_price, take_profit_price)，订单已不是 closing 时返回 None
+        """
+        with get_db_context() as db:
+            result = db.execute(
+                update(ArbitrageOrder)
+                .where(ArbitrageOrder.id == pk, ArbitrageOrder.status == 'closing')
+                .values(status='open')
+            )
+            if result.rowcount != 1:
+                return None
+            return db.execute(
+                select(
+                    ArbitrageOrder.symbol,
+                    ArbitrageOrder.lighter_side,
+                    ArbitrageOrder.stop_loss_price,
+                    ArbitrageOrder.take_profit_price
+                ).where(ArbitrageOrder.id == pk)
+            ).one()
+    
+    def _update_order(self, pk: int, **values):
+        """按主键直接 UPDATE 订单字段，不加载 ORM 对象"""
+        with get_db_context() as db:
+            db.execute(
+                update(ArbitrageOrder)
+                .where(ArbitrageOrder.id == pk)
+                .values(**values)
+            )
+    
+    async def _next_trade_batch(self) -> List[dict]:
+        """等待成交记录并凑批，最多 TRADE_BATCH_SIZE 条或等待 TRADE_FLUSH_INTERVAL 秒"""
+        loop = asyncio.get_running_loop()
+        try:
+            batch = [await asyncio.wait_for(self._trade_queue.get(), timeout=TRADE_FLUSH_INTERVAL)]
+        except asyncio.TimeoutError:
+            return []
+        
+        deadline = loop.time() + TRADE_FLUSH_INTERVAL
+        while len(batch) < TRADE_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._trade_queue.get(), timeout=timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+    
+    async def _write_trades(self, batch: List[dict]):
+        """批量写入成交记录，完成后标记队列任务"""
+        try:
+            await asyncio.to_thread(self._insert_trades, batch)
+        except Exception as e:
+            logger.error(f"记录成交失败: {e}")
+        finally:
+            for _ in batch:
+                self._trade_queue.task_done()
+    
+    def _insert_trades(self, rows: List[dict]):
+        """一次 INSERT 写入多条成交记录"""
+        with get_db_context() as db:
+            db.execute(insert(Trade), rows)
+    
     def _record_trade(
         self,
         order_id: str,
@@ -375,25 +784,25 @@ class OrderExecutor:
         action: str,
         price: Decimal,
         amount: Decimal,
-        exchange_order_id: str
+        exchange_order_id: str,
+        timestamp: int
     ):
-        """记录成交"""
-        try:
-            with get_db_context() as db:
-                trade = Trade(
-                    order_id=order_id,
-                    exchange=exchange,
-                    symbol=symbol,
-                    side=side,
-                    action=action,
-                    price=price,
-                    amount=amount,
-                    exchange_order_id=exchange_order_id,
-                    timestamp=int(datetime.now().timestamp() * 1000)
-                )
-                db.add(trade)
-        except Exception as e:
-            logger.error(f"记录成交失败: {e}")
+        """
+        记录成交（放入队列，由后台写入循环批量落库）
+        
+        同一批两边的成交在同一次事件循环调度内入队，写入循环会把它们合并到同一条多行 INSERT
+        """
+        self._trade_queue.put_nowait({
+            'order_id': order_id,
+            'exchange': exchange,
+            'symbol': symbol,
+            'side': side,
+            'action': action,
+            'price': price,
+            'amount': amount,
+            'exchange_order_id': exchange_order_id,
+            'timestamp': timestamp
+        })
     
     async def _set_stop_loss_take_profit(
         self,
@@ -425,22 +834,28 @@ class OrderExecutor:
             logger.error(f"设置止损止盈失败: {e}")
     
     async def _get_avg_entry_price(self, order_id: str, exchange: str) -> Decimal:
-        """计算平均开仓价"""
+        """计算平均开仓价（数据库查询在线程池中执行，不阻塞事件循环）"""
+        return await asyncio.to_thread(self._query_avg_entry_price, order_id, exchange)
+    
+    def _query_avg_entry_price(self, order_id: str, exchange: str) -> Decimal:
+        """查询成交记录计算平均开仓价"""
         try:
             with get_db_context() as db:
-                trades = db.query(Trade).filter(
-                    Trade.order_id == order_id,
-                    Trade.exchange == exchange,
-                    Trade.action == 'open'
-                ).all()
-                
-                if not trades:
-                    return Decimal('0')
-                
-                total_amount = sum(t.amount for t in trades)
-                total_value = sum(t.price * t.amount for t in trades)
-                
-                return total_value / total_amount if total_amount > 0 else Decimal('0')
+                total_value, total_amount = db.execute(
+                    select(
+                        func.sum(Trade.price * Trade.amount),
+                        func.sum(Trade.amount)
+                    ).where(
+                        Trade.order_id == order_id,
+                        Trade.exchange == exchange,
+                        Trade.action == 'open'
+                    )
+                ).one()
+            
+            if not total_amount:
+                return Decimal('0')
+            
+            return _to_decimal(total_value) / _to_decimal(total_amount)
         except Exception as e:
             logger.error(f"计算平均价失败: {e}")
             return Decimal('0')
@@ -3,12 +3,60 @@ from typing import Dict, Optional, List
 from decimal import Decimal
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import Float, and_, bindparam, case, cast, func, lambda_stmt, select
 from ..models import ArbitrageOrder, Trade, PnLRecord, FundingRate
-from ..database import get_db_context
+from ..database import get_db_context, upsert
 
 logger = logging.getLogger(__name__)
 
+# 重复计算同一订单时需要覆盖的盈亏字段
+PNL_RECORD_UPDATE_COLUMNS = (
+    'price_pnl',
+    'lighter_funding_pnl',
+    'binance_funding_pnl',
+    'total_funding_pnl',
+    'lighter_fees',
+    'binance_fees',
+    'total_fees',
+    'net_pnl',
+    'roi',
+    'holding_hours',
+)
+
+# 盈亏计算每次平仓都会执行，以下语句模块加载时构建一次，SQL 编译结果由 SQLAlchemy 缓存复用
+# 持仓期间两边资金费率之和
+FUNDING_RATE_SUMS_STMT = lambda_stmt(lambda: select(
+    FundingRate.exchange,
+    func.sum(FundingRate.funding_rate)
+).where(
+    FundingRate.exchange.in_(['lighter', 'binance']),
+    FundingRate.symbol == bindparam('symbol'),
+    FundingRate.timestamp.between(bindparam('start_time'), bindparam('end_time'))
+).group_by(FundingRate.exchange))
+
+# 价差盈亏：开多/平空为支出，开空/平多为收入
+PRICE_PNL_STMT = lambda_stmt(lambda: select(
+    func.sum(case(
+        (and_(Trade.action == 'open', Trade.side == 'long'), -1),  # 买入支出
+        (and_(Trade.action == 'open', Trade.side == 'short'), 1),  # 卖出收入
+        (and_(Trade.action == 'close', Trade.side == 'long'), 1),  # 平多收入
+        else_=-1  # 平空支出
+    ) * Trade.price * Trade.amount)
+).where(
+    Trade.order_id == bindparam('order_id'),
+    Trade.exchange.in_(['lighter', 'binance'])
+))
+
+# 按交易所分组的手续费
+FEES_BY_EXCHANGE_STMT = lambda_stmt(lambda: select(
+    Trade.exchange,
+    func.sum(Trade.fee)
+).where(
+    Trade.order_id == bindparam('order_id'),
+    Trade.exchange.in_(['lighter', 'binance']),
+    Trade.fee.isnot(None)
+).group_by(Trade.exchange))
+
 
 class PnLCalculator:
     """盈亏计算器 - 计算交易盈亏"""
@@ -32,20 +80,31 @@ class PnLCalculator:
                 if not order or order.status != 'closed':
                     return None
                 
+                # 资金费率只取持仓期间两边各自的累计值
+                rate_sums = db.execute(FUNDING_RATE_SUMS_STMT, {
+                    'symbol': order.symbol,
+                    'start_time': int(order.created_at.timestamp() * 1000),
+                    'end_time': int(order.updated_at.timestamp() * 1000),
+                }).all()
+                
+                funding_rate_sums = {'lighter': Decimal('0'), 'binance': Decimal('0')}
+                for exchange, rate_sum in rate_sums:
+                    funding_rate_sums[exchange] = rate_sum or Decimal('0')
+                
                 # 计算各项盈亏
-                price_pnl = self._calculate_price_pnl(order_id)
-                funding_pnl = self._calculate_funding_pnl(order_id, order)
-                fees = self._calculate_fees(order_id)
+                price_pnl = self._calculate_price_pnl(db, order_id)
+                funding_pnl = self._calculate_funding_pnl(funding_rate_sums, order)
+                fees = self._calculate_fees(db, order_id)
                 
-                # 总盈亏
+                # 总盈亏（入库前全程保持 Decimal）
                 net_pnl = price_pnl + funding_pnl['total'] - fees['total']
                 
                 # ROI
-                initial_investment = float(order.lighter_entry_amount + order.binance_entry_amount)
-                roi = (net_pnl / initial_investment * 100) if initial_investment > 0 else 0
+                initial_investment = order.lighter_entry_amount + order.binance_entry_amount
+                roi = (net_pnl / initial_investment * 100) if initial_investment > 0 else Decimal('0')
                 
                 # 持仓时间
-                holding_hours = (order.updated_at - order.created_at).total_seconds() / 3600
+                holding_hours = Decimal((order.updated_at - order.created_at).total_seconds()) / 3600
                 
                 pnl_data = {
                     'order_id': order_id,
@@ -78,176 +137,86 @@ class PnLCalculator:
                 # 保存到数据库
                 self._save_pnl_record(pnl_data)
                 
-                return pnl_data
+                # 返回给调用方的数值统一转为 float
+                return {
+                    key: float(value) if isinstance(value, Decimal) else value
+                    for key, value in pnl_data.items()
+                }
         except Exception as e:
-            logger.error(f"计算订单盈亏失败: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"计算订单盈亏失败: {e}")
             return None
     
-    def _calculate_price_pnl(self, order_id: str) -> float:
-        """计算价差盈亏"""
+    def _calculate_price_pnl(self, db: Session, order_id: str) -> Decimal:
+        """计算价差盈亏（由数据库直接求和）"""
         try:
-            with get_db_context() as db:
-                # 获取所有成交记录
-                trades = db.query(Trade).filter(
-                    Trade.order_id == order_id
-                ).all()
-                
-                lighter_pnl = Decimal('0')
-                binance_pnl = Decimal('0')
-                
-                for trade in trades:
-                    value = trade.price * trade.amount
-                    
-                    if trade.exchange == 'lighter':
-                        if trade.action == 'open':
-                            if trade.side == 'long':
-                                lighter_pnl -= value  # 买入支出
-                            else:  # short
-                                lighter_pnl += value  # 卖出收入
-                        else:  # close
-                            if trade.side == 'long':
-                                lighter_pnl += value  # 平多收入
-                            else:  # short
-                                lighter_pnl -= value  # 平空支出
-                    
-                    elif trade.exchange == 'binance':
-                        if trade.action == 'open':
-                            if trade.side == 'long':
-                                binance_pnl -= value
-                            else:
-                                binance_pnl += value
-                        else:
-                            if trade.side == 'long':
-                                binance_pnl += value
-                            else:
-                                binance_pnl -= value
-                
-                return float(lighter_pnl + binance_pnl)
+            total = db.execute(PRICE_PNL_STMT, {'order_id': order_id}).scalar()
+            
+            return total or Decimal('0')
         except Exception as e:
             logger.error(f"计算价差盈亏失败: {e}")
-            return 0.0
+            return Decimal('0')
     
-    def _calculate_funding_pnl(self, order_id: str, order: ArbitrageOrder) -> Dict:
-        """计算资金费率盈亏"""
+    def _calculate_funding_pnl(self, funding_rate_sums: Dict[str, Decimal], order: ArbitrageOrder) -> Dict:
+        """计算资金费率盈亏（持仓价值固定，盈亏 = 持仓价值 × 期间费率之和）"""
         try:
-            with get_db_context() as db:
-                symbol = order.symbol
-                start_time = int(order.created_at.timestamp() * 1000)
-                end_time = int(order.updated_at.timestamp() * 1000)
-                
-                # 获取该时间段的资金费率
-                lighter_rates = db.query(FundingRate).filter(
-                    FundingRate.exchange == 'lighter',
-                    FundingRate.symbol == symbol,
-                    FundingRate.timestamp >= start_time,
-                    FundingRate.timestamp <= end_time
-                ).all()
-                
-                binance_rates = db.query(FundingRate).filter(
-                    FundingRate.exchange == 'binance',
-                    FundingRate.symbol == symbol,
-                    FundingRate.timestamp >= start_time,
-                    FundingRate.timestamp <= end_time
-                ).all()
-                
-                # 计算 Lighter 资金费率盈亏
-                lighter_funding = Decimal('0')
-                position_value = order.lighter_entry_amount * order.lighter_leverage
-                
-                for rate in lighter_rates:
-                    if order.lighter_side == 'long':
-                        lighter_funding -= position_value * rate.funding_rate
-                    else:  # short
-                        lighter_funding += position_value * rate.funding_rate
-                
-                # 计算币安资金费率盈亏
-                binance_funding = Decimal('0')
-                position_value = order.binance_entry_amount * order.binance_leverage
-                
-                for rate in binance_rates:
-                    if order.binance_side == 'long':
-                        binance_funding -= position_value * rate.funding_rate
-                    else:  # short
-                        binance_funding += position_value * rate.funding_rate
-                
-                return {
-                    'lighter': float(lighter_funding),
-                    'binance': float(binance_funding),
-                    'total': float(lighter_funding + binance_funding)
-                }
+            # 计算 Lighter 资金费率盈亏：多头支付，空头收取
+            position_value = order.lighter_entry_amount * order.lighter_leverage
+            sign = -1 if order.lighter_side == 'long' else 1
+            lighter_funding = sign * position_value * funding_rate_sums['lighter']
+            
+            # 计算币安资金费率盈亏
+            position_value = order.binance_entry_amount * order.binance_leverage
+            sign = -1 if order.binance_side == 'long' else 1
+            binance_funding = sign * position_value * funding_rate_sums['binance']
+            
+            return {
+                'lighter': lighter_funding,
+                'binance': binance_funding,
+                'total': lighter_funding + binance_funding
+            }
         except Exception as e:
             logger.error(f"计算资金费率盈亏失败: {e}")
-            return {'lighter': 0.0, 'binance': 0.0, 'total': 0.0}
+            return {'lighter': Decimal('0'), 'binance': Decimal('0'), 'total': Decimal('0')}
     
-    def _calculate_fees(self, order_id: str) -> Dict:
-        """计算手续费"""
+    def _calculate_fees(self, db: Session, order_id: str) -> Dict:
+        """计算手续费（按交易所分组求和）"""
         try:
-            with get_db_context() as db:
-                trades = db.query(Trade).filter(
-                    Trade.order_id == order_id
-                ).all()
-                
-                lighter_fees = sum(
-                    float(t.fee) for t in trades
-                    if t.exchange == 'lighter' and t.fee
-                )
-                
-                binance_fees = sum(
-                    float(t.fee) for t in trades
-                    if t.exchange == 'binance' and t.fee
-                )
-                
-                return {
-                    'lighter': lighter_fees,
-                    'binance': binance_fees,
-                    'total': lighter_fees + binance_fees
-                }
+            rows = db.execute(FEES_BY_EXCHANGE_STMT, {'order_id': order_id}).all()
+            
+            fees_by_exchange = {'lighter': Decimal('0'), 'binance': Decimal('0')}
+            for exchange, fee_sum in rows:
+                fees_by_exchange[exchange] = fee_sum or Decimal('0')
+            
+            lighter_fees = fees_by_exchange['lighter']
+            binance_fees = fees_by_exchange['binance']
+            
+            return {
+                'lighter': lighter_fees,
+                'binance': binance_fees,
+                'total': lighter_fees + binance_fees
+            }
         except Exception as e:
             logger.error(f"计算手续费失败: {e}")
-            return {'lighter': 0.0, 'binance': 0.0, 'total': 0.0}
+            return {'lighter': Decimal('0'), 'binance': Decimal('0'), 'total': Decimal('0')}
     
     def _save_pnl_record(self, pnl_data: Dict):
-        """保存盈亏记录"""
+        """保存盈亏记录（按 order_id 一条语句插入或更新）"""
         try:
+            values = {
+                'order_id': pnl_data['order_id'],
+                'symbol': pnl_data['symbol'],
+                'open_time': pnl_data['open_time'],
+                'closed_at': pnl_data['close_time'],
+            }
+            for col in PNL_RECORD_UPDATE_COLUMNS:
+                values[col] = pnl_data[col]
+            
             with get_db_context() as db:
-                # 检查是否已存在
-                existing = db.query(PnLRecord).filter(
-                    PnLRecord.order_id == pnl_data['order_id']
-                ).first()
-                
-                if existing:
-                    # 更新
-                    existing.price_pnl = Decimal(str(pnl_data['price_pnl']))
-                    existing.lighter_funding_pnl = Decimal(str(pnl_data['lighter_funding_pnl']))
-                    existing.binance_funding_pnl = Decimal(str(pnl_data['binance_funding_pnl']))
-                    existing.total_funding_pnl = Decimal(str(pnl_data['total_funding_pnl']))
-                    existing.lighter_fees = Decimal(str(pnl_data['lighter_fees']))
-                    existing.binance_fees = Decimal(str(pnl_data['binance_fees']))
-                    existing.total_fees = Decimal(str(pnl_data['total_fees']))
-                    existing.net_pnl = Decimal(str(pnl_data['net_pnl']))
-                    existing.roi = Decimal(str(pnl_data['roi']))
-                    existing.holding_hours = Decimal(str(pnl_data['holding_hours']))
-                else:
-                    # 新增
-                    record = PnLRecord(
-                        order_id=pnl_data['order_id'],
-                        symbol=pnl_data['symbol'],
-                        price_pnl=Decimal(str(pnl_data['price_pnl'])),
-                        lighter_funding_pnl=Decimal(str(pnl_data['lighter_funding_pnl'])),
-                        binance_funding_pnl=Decimal(str(pnl_data['binance_funding_pnl'])),
-                        total_funding_pnl=Decimal(str(pnl_data['total_funding_pnl'])),
-                        lighter_fees=Decimal(str(pnl_data['lighter_fees'])),
-                        binance_fees=Decimal(str(pnl_data['binance_fees'])),
-                        total_fees=Decimal(str(pnl_data['total_fees'])),
-                        net_pnl=Decimal(str(pnl_data['net_pnl'])),
-                        roi=Decimal(str(pnl_data['roi'])),
-                        open_time=pnl_data['open_time'],
-                        closed_at=pnl_data['close_time'],
-                        holding_hours=Decimal(str(pnl_data['holding_hours']))
-                    )
-                    db.add(record)
+                db.execute(upsert(
+                    db, PnLRecord, values,
+                    index_elements=['order_id'],
+                    update_columns=list(PNL_RECORD_UPDATE_COLUMNS)
+                ))
         except Exception as e:
             logger.error(f"保存盈亏记录失败: {e}")
     
@@ -265,11 +234,16 @@ class PnLCalculator:
             with get_db_context() as db:
                 start_date = datetime.now() - timedelta(days=days)
                 
-                records = db.query(PnLRecord).filter(
+                total_orders, total_pnl, win_orders, avg_roi = db.query(
+                    func.count(PnLRecord.id),
+                    func.sum(PnLRecord.net_pnl),
+                    func.sum(case((PnLRecord.net_pnl > 0, 1), else_=0)),
+                    func.avg(PnLRecord.roi)
+                ).filter(
                     PnLRecord.closed_at >= start_date
-                ).all()
+                ).one()
                 
-                if not records:
+                if not total_orders:
                     return {
                         'total_pnl': 0,
                         'total_orders': 0,
@@ -278,12 +252,11 @@ class PnLCalculator:
                         'avg_roi': 0
                     }
                 
-                total_pnl = sum(float(r.net_pnl) for r in records)
-                total_orders = len(records)
-                win_orders = sum(1 for r in records if r.net_pnl > 0)
-                win_rate = win_orders / total_orders * 100 if total_orders > 0 else 0
-                avg_pnl = total_pnl / total_orders if total_orders > 0 else 0
-                avg_roi = sum(float(r.roi) for r in records) / total_orders if total_orders > 0 else 0
+                total_pnl = float(total_pnl or 0)
+                win_orders = int(win_orders or 0)
+                win_rate = win_orders / total_orders * 100
+                avg_pnl = total_pnl / total_orders
+                avg_roi = float(avg_roi or 0)
                 
                 return {
                     'total_pnl': total_pnl,
@@ -317,7 +290,18 @@ class PnLCalculator:
         """
         try:
             with get_db_context() as db:
-                records = db.query(PnLRecord).order_by(
+                # 只查询需要返回的列，金额在 SQL 中转换为浮点数
+                records = db.query(
+                    PnLRecord.order_id,
+                    PnLRecord.symbol,
+                    cast(PnLRecord.price_pnl, Float).label('price_pnl'),
+                    cast(PnLRecord.total_funding_pnl, Float).label('total_funding_pnl'),
+                    cast(PnLRecord.total_fees, Float).label('total_fees'),
+                    cast(PnLRecord.net_pnl, Float).label('net_pnl'),
+                    cast(PnLRecord.roi, Float).label('roi'),
+                    cast(PnLRecord.holding_hours, Float).label('holding_hours'),
+                    PnLRecord.closed_at
+                ).order_by(
                     PnLRecord.closed_at.desc()
                 ).limit(limit).all()
                 
@@ -325,12 +309,12 @@ class PnLCalculator:
                     {
                         'order_id': r.order_id,
                         'symbol': r.symbol,
-                        'price_pnl': float(r.price_pnl),
-                        'total_funding_pnl': float(r.total_funding_pnl),
-                        'total_fees': float(r.total_fees),
-                        'net_pnl': float(r.net_pnl),
-                        'roi': float(r.roi),
-                        'holding_hours': float(r.holding_hours),
+                        'price_pnl': r.price_pnl,
+                        'total_funding_pnl': r.total_funding_pnl,
+                        'total_fees': r.total_fees,
+                        'net_pnl': r.net_pnl,
+                        'roi': r.roi,
+                        'holding_hours': r.holding_hours,
                         'closed_at': r.closed_at.isoformat()
                     }
                     for r in records
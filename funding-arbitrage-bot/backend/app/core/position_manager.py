@@ -1,9 +1,11 @@
+import asyncio
 import logging
+from contextlib import contextmanager
 from typing import Dict, List, Optional
 from decimal import Decimal
 from datetime import datetime
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import Float, cast, func, update
 from ..exchanges.lighter_client import LighterClient
 from ..exchanges.binance_client import BinanceClient
 from ..models import ArbitrageOrder, Trade
@@ -18,168 +20,223 @@ class PositionManager:
     def __init__(
         self,
         lighter_client: LighterClient,
-        binance_client: BinanceClient
+        binance_client: BinanceClient,
+        session_factory=get_db_context
     ):
         self.lighter = lighter_client
         self.binance = binance_client
+        self.session_factory = session_factory
     
-    async def get_all_positions(self) -> List[Dict]:
+    async def get_all_positions(self, db: Optional[Session] = None) -> List[Dict]:
         """
         获取所有持仓
         
+        Args:
+            db: 调用方的数据库会话（可选，不传则自行创建）
+            
         Returns:
             持仓列表
         """
         try:
-            with get_db_context() as db:
-                orders = db.query(ArbitrageOrder).filter(
-                    ArbitrageOrder.status.in_(['open', 'opening'])
-                ).all()
-                
-                positions = []
-                for order in orders:
-                    position = await self.get_position_detail(order.order_id)
-                    if position:
-                        positions.append(position)
-                
-                return positions
+            orders = await asyncio.to_thread(
+                self._load_orders,
+                ArbitrageOrder.status.in_(['open', 'opening']),
+                db=db
+            )
+            return await self._build_positions(orders)
         except Exception as e:
             logger.error(f"获取所有持仓失败: {e}")
             return []
     
-    async def get_position_by_symbol(self, symbol: str) -> List[Dict]:
+    async def get_position_by_symbol(self, symbol: str, db: Optional[Session] = None) -> List[Dict]:
         """
         按交易对查询持仓
         
         Args:
             symbol: 交易对
+            db: 调用方的数据库会话（可选）
             
         Returns:
             持仓列表
         """
         try:
-            with get_db_context() as db:
-                orders = db.query(ArbitrageOrder).filter(
-                    ArbitrageOrder.symbol == symbol,
-                    ArbitrageOrder.status.in_(['open', 'opening'])
-                ).all()
-                
-                positions = []
-                for order in orders:
-                    position = await self.get_position_detail(order.order_id)
-                    if position:
-                        positions.append(position)
-                
-                return positions
+            orders = await asyncio.to_thread(
+                self._load_orders,
+                ArbitrageOrder.symbol == symbol,
+                ArbitrageOrder.status.in_(['open', 'opening']),
+                db=db
+            )
+            return await self._build_positions(orders)
         except Exception as e:
             logger.error(f"按交易对查询持仓失败: {e}")
             return []
     
-    async def get_position_detail(self, order_id: str) -> Optional[Dict]:
+    async def get_position_detail(self, order_id: str, db: Optional[Session] = None) -> Optional[Dict]:
         """
         获取持仓详情
         
         Args:
             order_id: 订单ID
+            db: 调用方的数据库会话（可选）
             
         Returns:
             持仓详情
         """
         try:
-            with get_db_context() as db:
-                order = db.query(ArbitrageOrder).filter(
-                    ArbitrageOrder.order_id == order_id
-                ).first()
-                
-                if not order:
-                    return None
-                
-                # 获取实时持仓数据
-                lighter_position = await self.lighter.get_position(order.symbol)
-                binance_position = await self.binance.get_position(order.symbol)
-                
-                # 计算未实现盈亏
-                unrealized_pnl = await self.calculate_unrealized_pnl(order_id)
-                
-                # 获取当前价格
-                current_price = await self.lighter.get_price(order.symbol)
-                
-                # 计算持仓时间
-                holding_hours = (datetime.now() - order.created_at).total_seconds() / 3600
-                
-                return {
-                    'order_id': order.order_id,
-                    'symbol': order.symbol,
-                    'strategy_type': order.strategy_type,
-                    'status': order.status,
-                    
-                    # Lighter 信息
-                    'lighter': {
-                        'side': order.lighter_side,
-                        'entry_price': float(order.lighter_entry_price) if order.lighter_entry_price else 0,
-                        'entry_amount': float(order.lighter_entry_amount),
-                        'filled_amount': float(order.lighter_filled_amount),
-                        'leverage': order.lighter_leverage,
-                        'current_amount': float(lighter_position.get('amount', 0)) if lighter_position else 0,
-                        'unrealized_pnl': float(lighter_position.get('unrealized_pnl', 0)) if lighter_position else 0,
-                    },
-                    
-                    # 币安信息
-                    'binance': {
-                        'side': order.binance_side,
-                        'entry_price': float(order.binance_entry_price) if order.binance_entry_price else 0,
-                        'entry_amount': float(order.binance_entry_amount),
-                        'filled_amount': float(order.binance_filled_amount),
-                        'leverage': order.binance_leverage,
-                        'current_amount': float(binance_position.get('amount', 0)) if binance_position else 0,
-                        'unrealized_pnl': float(binance_position.get('unrealized_pnl', 0)) if binance_position else 0,
-                    },
-                    
-                    # 总计信息
-                    'current_price': float(current_price) if current_price else 0,
-                    'imbalance_amount': float(order.imbalance_amount),
-                    'total_unrealized_pnl': unrealized_pnl,
-                    'stop_loss_price': float(order.stop_loss_price) if order.stop_loss_price else None,
-                    'take_profit_price': float(order.take_profit_price) if order.take_profit_price else None,
-                    'entry_funding_rate_diff': float(order.entry_funding_rate_diff) if order.entry_funding_rate_diff else 0,
-                    
-                    # 时间信息
-                    'created_at': order.created_at.isoformat(),
-                    'holding_hours': round(holding_hours, 2),
-                }
+            orders = await asyncio.to_thread(
+                self._load_orders, ArbitrageOrder.order_id == order_id, db=db
+            )
+            if not orders:
+                return None
+            
+            order = orders[0]
+            market_data = await self._fetch_market_data(order.symbol)
+            return self._build_position_detail(order, *market_data)
         except Exception as e:
-            logger.error(f"获取持仓详情失败: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"获取持仓详情失败: {e}")
             return None
     
-    async def calculate_unrealized_pnl(self, order_id: str) -> float:
+    @contextmanager
+    def _session(self, db: Optional[Session] = None):
+        """优先使用调用方传入的会话，否则由 session_factory 新建"""
+        if db is not None:
+            yield db
+        else:
+            with self.session_factory() as db:
+                yield db
+    
+    def _load_orders(self, *criteria, db: Optional[Session] = None) -> List[ArbitrageOrder]:
+        """
+        一次查询加载订单（同步查询，异步方法中通过 asyncio.to_thread 调用）
+        
+        使用调用方的会话时订单留在其 identity map 中，同一请求内可复用；
+        自行创建会话时脱离会话，以便会话关闭后继续读取字段
+        """
+        if db is not None:
+            return db.query(ArbitrageOrder).filter(*criteria).all()
+        
+        with self.session_factory() as db:
+            orders = db.query(ArbitrageOrder).filter(*criteria).all()
+            db.expunge_all()
+            return orders
+    
+    async def _fetch_market_data(self, symbol: str) -> tuple:
+        """
+        并发获取交易对的实时数据
+        
+        Returns:
+            (lighter_position, binance_position, current_price)
+        """
+        return await asyncio.gather(
+            self.lighter.get_position(symbol),
+            self.binance.get_position(symbol),
+            self.lighter.get_price(symbol)
+        )
+    
+    async def _build_positions(self, orders: List[ArbitrageOrder]) -> List[Dict]:
+        """按交易对去重并发获取实时数据并组装持仓详情，单个交易对失败时跳过其订单"""
+        symbols = list({order.symbol for order in orders})
+        results = await asyncio.gather(
+            *(self._fetch_market_data(symbol) for symbol in symbols),
+            return_exceptions=True
+        )
+        market_data_by_symbol = dict(zip(symbols, results))
+        
+        now = datetime.now()
+        positions = []
+        for order in orders:
+            market_data = market_data_by_symbol[order.symbol]
+            if isinstance(market_data, Exception):
+                logger.error(f"获取持仓详情失败 {order.order_id}: {market_data}")
+                continue
+            positions.append(self._build_position_detail(order, *market_data, now=now))
+        return positions
+    
+    @staticmethod
+    def _unrealized_pnl(lighter_position: Optional[Dict], binance_position: Optional[Dict]) -> float:
+        """由两边实时持仓计算未实现盈亏"""
+        lighter_pnl = Decimal(str(lighter_position.get('unrealized_pnl', 0))) if lighter_position else Decimal('0')
+        binance_pnl = Decimal(str(binance_position.get('unrealized_pnl', 0))) if binance_position else Decimal('0')
+        return float(lighter_pnl + binance_pnl)
+    
+    def _build_position_detail(
+        self,
+        order: ArbitrageOrder,
+        lighter_position: Optional[Dict],
+        binance_position: Optional[Dict],
+        current_price: Optional[Decimal],
+        now: Optional[datetime] = None
+    ) -> Dict:
+        """由订单和已获取的实时数据组装持仓详情（不访问数据库和交易所），批量组装时由调用方传入同一个 now"""
+        # 计算持仓时间
+        holding_hours = ((now or datetime.now()) - order.created_at).total_seconds() / 3600
+        
+        return {
+            'order_id': order.order_id,
+            'symbol': order.symbol,
+            'strategy_type': order.strategy_type,
+            'status': order.status,
+            
+            # Lighter 信息
+            'lighter': {
+                'side': order.lighter_side,
+                'entry_price': float(order.lighter_entry_price) if order.lighter_entry_price else 0,
+                'entry_amount': float(order.lighter_entry_amount),
+                'filled_amount': float(order.lighter_filled_amount),
+                'leverage': order.lighter_leverage,
+                'current_amount': float(lighter_position.get('amount', 0)) if lighter_position else 0,
+                'unrealized_pnl': float(lighter_position.get('unrealized_pnl', 0)) if lighter_position else 0,
+            },
+            
+            # 币安信息
+            'binance': {
+                'side': order.binance_side,
+                'entry_price': float(order.binance_entry_price) if order.binance_entry_price else 0,
+                'entry_amount': float(order.binance_entry_amount),
+                'filled_amount': float(order.binance_filled_amount),
+                'leverage': order.binance_leverage,
+                'current_amount': float(binance_position.get('amount', 0)) if binance_position else 0,
+                'unrealized_pnl': float(binance_position.get('unrealized_pnl', 0)) if binance_position else 0,
+            },
+            
+            # 总计信息
+            'current_price': float(current_price) if current_price else 0,
+            'imbalance_amount': float(order.imbalance_amount),
+            'total_unrealized_pnl': self._unrealized_pnl(lighter_position, binance_position),
+            'stop_loss_price': float(order.stop_loss_price) if order.stop_loss_price else None,
+            'take_profit_price': float(order.take_profit_price) if order.take_profit_price else None,
+            'entry_funding_rate_diff': float(order.entry_funding_rate_diff) if order.entry_funding_rate_diff else 0,
+            
+            # 时间信息
+            'created_at': order.created_at.isoformat(),
+            'holding_hours': round(holding_hours, 2),
+        }
+    
+    async def calculate_unrealized_pnl(self, order_id: str, db: Optional[Session] = None) -> float:
         """
         计算未实现盈亏
         
         Args:
             order_id: 订单ID
+            db: 调用方的数据库会话（可选）
             
         Returns:
             未实现盈亏
         """
         try:
-            with get_db_context() as db:
-                order = db.query(ArbitrageOrder).filter(
-                    ArbitrageOrder.order_id == order_id
-                ).first()
-                
-                if not order:
-                    return 0.0
-                
-                # 获取实时持仓
-                lighter_position = await self.lighter.get_position(order.symbol)
-                binance_position = await self.binance.get_position(order.symbol)
-                
-                lighter_pnl = Decimal(str(lighter_position.get('unrealized_pnl', 0))) if lighter_position else Decimal('0')
-                binance_pnl = Decimal(str(binance_position.get('unrealized_pnl', 0))) if binance_position else Decimal('0')
-                
-                return float(lighter_pnl + binance_pnl)
+            orders = await asyncio.to_thread(
+                self._load_orders, ArbitrageOrder.order_id == order_id, db=db
+            )
+            if not orders:
+                return 0.0
+            
+            # 获取实时持仓
+            symbol = orders[0].symbol
+            lighter_position, binance_position = await asyncio.gather(
+                self.lighter.get_position(symbol),
+                self.binance.get_position(symbol)
+            )
+            return self._unrealized_pnl(lighter_position, binance_position)
         except Exception as e:
             logger.error(f"计算未实现盈亏失败: {e}")
             return 0.0
@@ -191,57 +248,86 @@ class PositionManager:
         这个方法会从交易所同步最新的持仓数据到数据库
         """
         try:
-            with get_db_context() as db:
-                orders = db.query(ArbitrageOrder).filter(
-                    ArbitrageOrder.status.in_(['open', 'opening'])
-                ).all()
+            orders = await asyncio.to_thread(
+                self._load_orders,
+                ArbitrageOrder.status.in_(['open', 'opening'])
+            )
+            if not orders:
+                return
+            
+            # 所有订单两边的实时持仓并发获取
+            results = await asyncio.gather(
+                *(
+                    asyncio.gather(
+                        self.lighter.get_position(order.symbol),
+                        self.binance.get_position(order.symbol)
+                    )
+                    for order in orders
+                ),
+                return_exceptions=True
+            )
+            
+            updated_at = datetime.now()
+            changes = []
+            for order, result in zip(orders, results):
+                if isinstance(result, Exception):
+                    logger.error(f"获取持仓失败 {order.order_id}: {result}")
+                    continue
                 
-                for order in orders:
-                    # 获取实时持仓
-                    lighter_position = await self.lighter.get_position(order.symbol)
-                    binance_position = await self.binance.get_position(order.symbol)
-                    
-                    # 更新不平衡金额
-                    lighter_amount = Decimal(str(lighter_position.get('amount', 0))) if lighter_position else Decimal('0')
-                    binance_amount = Decimal(str(binance_position.get('amount', 0))) if binance_position else Decimal('0')
-                    
-                    order.imbalance_amount = abs(lighter_amount - binance_amount)
-                    order.updated_at = datetime.now()
+                # 更新不平衡金额
+                lighter_position, binance_position = result
+                lighter_amount = Decimal(str(lighter_position.get('amount', 0))) if lighter_position else Decimal('0')
+                binance_amount = Decimal(str(binance_position.get('amount', 0))) if binance_position else Decimal('0')
                 
-                logger.info(f"更新了 {len(orders)} 个持仓")
+                changes.append({
+                    'id': order.id,
+                    'imbalance_amount': abs(lighter_amount - binance_amount),
+                    'updated_at': updated_at,
+                })
+            
+            if changes:
+                with self.session_factory() as db:
+                    db.execute(update(ArbitrageOrder), changes)
+            
+            logger.info(f"更新了 {len(changes)} 个持仓")
         except Exception as e:
             logger.error(f"更新持仓失败: {e}")
     
-    def get_position_summary(self) -> Dict:
+    def get_position_summary(self, db: Optional[Session] = None) -> Dict:
         """
         获取持仓汇总
         
+        Args:
+            db: 调用方的数据库会话（可选）
+            
         Returns:
             持仓汇总信息
         """
         try:
-            with get_db_context() as db:
-                # 统计各状态的订单数量
-                status_counts = db.query(
+            with self._session(db) as db:
+                # 一次查询统计各状态的订单数量和持仓金额
+                rows = db.query(
                     ArbitrageOrder.status,
-                    func.count(ArbitrageOrder.id)
+                    func.count(ArbitrageOrder.id),
+                    func.sum(ArbitrageOrder.lighter_entry_amount),
+                    func.sum(ArbitrageOrder.binance_entry_amount)
                 ).group_by(ArbitrageOrder.status).all()
                 
-                # 统计总持仓金额
-                open_orders = db.query(ArbitrageOrder).filter(
-                    ArbitrageOrder.status == 'open'
-                ).all()
+                status_counts = {status: count for status, count, _, _ in rows}
                 
-                total_lighter_amount = sum(
-                    float(o.lighter_entry_amount) for o in open_orders
-                )
-                total_binance_amount = sum(
-                    float(o.binance_entry_amount) for o in open_orders
-                )
+                # 统计总持仓金额（仅 open 状态）
+                open_positions = 0
+                total_lighter_amount = 0.0
+                total_binance_amount = 0.0
+                for status, count, lighter_sum, binance_sum in rows:
+                    if status == 'open':
+                        open_positions = count
+                        total_lighter_amount = float(lighter_sum or 0)
+                        total_binance_amount = float(binance_sum or 0)
                 
                 return {
-                    'status_counts': {status: count for status, count in status_counts},
-                    'open_positions': len(open_orders),
+                    'status_counts': status_counts,
+                    'open_positions': open_positions,
                     'total_lighter_amount': total_lighter_amount,
                     'total_binance_amount': total_binance_amount,
                     'total_amount': total_lighter_amount + total_binance_amount,
@@ -256,19 +342,33 @@ class PositionManager:
                 'total_amount': 0,
             }
     
-    def get_trades_by_order(self, order_id: str) -> List[Dict]:
+    def get_trades_by_order(self, order_id: str, db: Optional[Session] = None) -> List[Dict]:
         """
         获取订单的所有成交记录
         
         Args:
             order_id: 订单ID
+            db: 调用方的数据库会话（可选）
             
         Returns:
             成交记录列表
         """
         try:
-            with get_db_context() as db:
-                trades = db.query(Trade).filter(
+            with self._session(db) as db:
+                # 只查询需要返回的列，金额在 SQL 中转换为浮点数
+                trades = db.query(
+                    Trade.id,
+                    Trade.exchange,
+                    Trade.symbol,
+                    Trade.side,
+                    Trade.action,
+                    cast(Trade.price, Float).label('price'),
+                    cast(Trade.amount, Float).label('amount'),
+                    func.coalesce(cast(Trade.fee, Float), 0).label('fee'),
+                    Trade.exchange_order_id,
+                    Trade.timestamp,
+                    Trade.created_at
+                ).filter(
                     Trade.order_id == order_id
                 ).order_by(Trade.created_at).all()
                 
@@ -279,9 +379,9 @@ class PositionManager:
                         'symbol': t.symbol,
                         'side': t.side,
                         'action': t.action,
-                        'price': float(t.price),
-                        'amount': float(t.amount),
-                        'fee': float(t.fee) if t.fee else 0,
+                        'price': t.price,
+                        'amount': t.amount,
+                        'fee': t.fee,
                         'exchange_order_id': t.exchange_order_id,
                         'timestamp': t.timestamp,
                         'created_at': t.created_at.isoformat(),
@@ -295,7 +395,8 @@ class PositionManager:
     def get_position_history(
         self,
         symbol: Optional[str] = None,
-        limit: int = 50
+        limit: int = 50,
+        db: Optional[Session] = None
     ) -> List[Dict]:
         """
         获取历史持仓
@@ -303,13 +404,22 @@ class PositionManager:
         Args:
             symbol: 交易对（可选）
             limit: 返回数量限制
+            db: 调用方的数据库会话（可选）
             
         Returns:
             历史持仓列表
         """
         try:
-            with get_db_context() as db:
-                query = db.query(ArbitrageOrder).filter(
+            with self._session(db) as db:
+                query = db.query(
+                    ArbitrageOrder.order_id,
+                    ArbitrageOrder.symbol,
+                    ArbitrageOrder.strategy_type,
+                    ArbitrageOrder.lighter_side,
+                    ArbitrageOrder.binance_side,
+                    ArbitrageOrder.created_at,
+                    ArbitrageOrder.updated_at
+                ).filter(
                     ArbitrageOrder.status == 'closed'
                 )
                 
@@ -1,16 +1,77 @@
 import logging
 import asyncio
+from contextlib import contextmanager
+from dataclasses import dataclass
 from typing import Dict, List, Optional
 from decimal import Decimal
 from datetime import datetime
+from sqlalchemy import Row, insert
 from sqlalchemy.orm import Session
 from ..exchanges.lighter_client import LighterClient
 from ..exchanges.binance_client import BinanceClient
 from ..models import ArbitrageOrder, SystemLog
-from ..database import get_db_context
+from ..database import SessionLocal, get_db_context
+from ..utils.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+# 每轮风控检查同时访问交易所的最大订单数
+MAX_CONCURRENT_CHECKS = 20
+
+# 各监控循环共享的行情缓存时间（秒）
+PRICE_CACHE_TTL = 0.5
+POSITION_CACHE_TTL = 2.0
+BALANCE_CACHE_TTL = 30.0
+
+# 持仓/爆仓监控共享的订单快照刷新间隔（秒），与最快的持仓监控周期一致
+ORDERS_REFRESH_INTERVAL = 5.0
+
+# 风控检查用到的订单字段，只查询这些列，不构造完整 ORM 对象
+MONITOR_ORDER_COLUMNS = (
+    ArbitrageOrder.order_id,
+    ArbitrageOrder.symbol,
+    ArbitrageOrder.status,
+    ArbitrageOrder.lighter_side,
+    ArbitrageOrder.binance_side,
+    ArbitrageOrder.lighter_entry_amount,
+    ArbitrageOrder.binance_entry_amount,
+)
+
+# 告警日志批量写入：单批最多条数 / 凑批最长等待时间（秒）
+ALERT_BATCH_SIZE = 100
+ALERT_FLUSH_INTERVAL = 0.5
+# 告警队列上限，告警风暴时丢弃最早的告警，避免内存无限增长
+ALERT_QUEUE_MAXSIZE = 10000
+
+
+@dataclass(slots=True)
+class StopOrder:
+    """
+    止损止盈监控所需的订单字段
+    
+    direction 多头为 1、空头为 -1，阈值预先乘以 direction：
+    direction * 价格 <= stop_loss_bound 触发止损，>= take_profit_bound 触发止盈，
+    未设置的阈值取 ±inf，永不触发
+    """
+    order_id: str
+    symbol: str
+    direction: float
+    stop_loss_bound: float
+    take_profit_bound: float
+    stop_loss_price: Optional[Decimal]
+    take_profit_price: Optional[Decimal]
+
+
+@dataclass(slots=True)
+class MonitoredOrder:
+    """持仓/爆仓监控所需的订单字段，刷新快照时一次性把 Decimal 换算为 float"""
+    order_id: str
+    symbol: str
+    status: str
+    lighter_side: str
+    binance_side: str
+    initial_investment: float
+
 
 class RiskManager:
     """风险管理器 - 监控风险并执行保护措施"""
@@ -30,63 +91,279 @@ class RiskManager:
             'min_margin_ratio': 0.3,  # 最小保证金率 30%
             'liquidation_buffer': 0.05,  # 爆仓价格缓冲 5%
         }
+        self._check_semaphore = asyncio.Semaphore(MAX_CONCURRENT_CHECKS)
+        # 键为 (交易所, 数据类型, 交易对)，避免不同监控循环重复请求同一数据
+        self._market_cache = TTLCache(ttl=PRICE_CACHE_TTL)
+        # 止损止盈监控列表：启动时从数据库加载一次，之后由 OrderExecutor 建仓/平仓时维护
+        self._stop_orders: Dict[str, StopOrder] = {}
+        # 未平仓订单快照（open/opening），由 _refresh_orders 定时刷新，各监控循环共享同一次查询结果
+        self._open_orders: List[MonitoredOrder] = []
+        # 只读查询复用的会话，写入（告警/紧急平仓）仍使用独立的事务会话
+        self._read_session: Optional[Session] = None
+        # 告警日志队列，由 _alert_writer 批量落库
+        self._alert_queue: asyncio.Queue = asyncio.Queue(maxsize=ALERT_QUEUE_MAXSIZE)
+        self._dropped_alerts = 0
     
     async def start(self):
         """启动风险监控"""
         self.running = True
         logger.info("风险管理器启动")
         
+        # 同步查询放到线程池执行，不阻塞事件循环（两次调用先后执行，只读会话不会被并发使用）
+        await asyncio.to_thread(self._load_stop_orders)
+        await asyncio.to_thread(self._refresh_open_orders)
+        
         tasks = [
+            self._refresh_orders(),
             self._monitor_positions(),
             self._monitor_stop_loss_take_profit(),
             self._monitor_liquidation_risk(),
-            self._monitor_balance()
+            self._monitor_balance(),
+            self._alert_writer()
         ]
         await asyncio.gather(*tasks)
     
     async def stop(self):
         """停止风险监控"""
         self.running = False
+        await self.flush_alerts()
+        if self._read_session is not None:
+            self._read_session.close()
+            self._read_session = None
         logger.info("风险管理器停止")
     
+    async def flush_alerts(self):
+        """立即写入队列中的告警日志，并等待后台正在写入的批次完成"""
+        batch = []
+        while not self._alert_queue.empty():
+            batch.append(self._alert_queue.get_nowait())
+        if batch:
+            await self._write_alerts(batch)
+        await self._alert_queue.join()
+    
+    async def _alert_writer(self):
+        """告警日志写入循环"""
+        while self.running:
+            try:
+                batch = await self._next_alert_batch()
+                if batch:
+                    await self._write_alerts(batch)
+                if self._dropped_alerts:
+                    logger.warning(f"告警队列已满，丢弃了 {self._dropped_alerts} 条最早的告警")
+                    self._dropped_alerts = 0
+            except Exception as e:
+                logger.error(f"告警日志写入循环错误: {e}")
+    
+    async def _next_alert_batch(self) -> List[dict]:
+        """等待告警并凑批，最多 ALERT_BATCH_SIZE 条或等待 ALERT_FLUSH_INTERVAL 秒"""
+        loop = asyncio.get_running_loop()
+        try:
+            batch = [await asyncio.wait_for(self._alert_queue.get(), timeout=ALERT_FLUSH_INTERVAL)]
+        except asyncio.TimeoutError:
+            return []
+        
+        deadline = loop.time() + ALERT_FLUSH_INTERVAL
+        while len(batch) < ALERT_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._alert_queue.get(), timeout=timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+    
+    async def _write_alerts(self, batch: List[dict]):
+        """一个事务内写入一批告警日志，完成后标记队列任务"""
+        try:
+            await asyncio.to_thread(self._insert_alerts, batch)
+        except Exception as e:
+            logger.error(f"记录告警失败: {e}")
+        finally:
+            for _ in batch:
+                self._alert_queue.task_done()
+    
+    def _insert_alerts(self, rows: List[dict]):
+        """一次 INSERT 写入多条告警日志"""
+        with get_db_context() as db:
+            db.execute(insert(SystemLog), rows)
+    
+    @contextmanager
+    def _read_db(self):
+        """复用只读会话；查询后 rollback 结束读事务并归还连接（只读无需 COMMIT）"""
+        if self._read_session is None:
+            self._read_session = SessionLocal()
+        try:
+            yield self._read_session
+        finally:
+            self._read_session.rollback()
+    
+    def _load_orders(self, *criteria) -> List[Row]:
+        """按列加载订单（轻量 Row），检查期间不占用数据库连接"""
+        with self._read_db() as db:
+            return db.query(*MONITOR_ORDER_COLUMNS).filter(*criteria).all()
+    
+    def _refresh_open_orders(self):
+        """重新加载未平仓订单快照"""
+        try:
+            rows = self._load_orders(
+                ArbitrageOrder.status.in_(['open', 'opening'])
+            )
+            self._open_orders = [
+                MonitoredOrder(
+                    row.order_id,
+                    row.symbol,
+                    row.status,
+                    row.lighter_side,
+                    row.binance_side,
+                    float(row.lighter_entry_amount or 0) + float(row.binance_entry_amount or 0)
+                )
+                for row in rows
+            ]
+        except Exception as e:
+            logger.error(f"刷新订单快照失败: {e}")
+    
+    async def _refresh_orders(self):
+        """订单快照刷新循环（启动时已加载一次）"""
+        while self.running:
+            await asyncio.sleep(ORDERS_REFRESH_INTERVAL)
+            await asyncio.to_thread(self._refresh_open_orders)
+    
+    async def _get_position(self, exchange: str, symbol: str) -> Optional[Dict]:
+        """获取实时持仓（短时缓存）"""
+        client = self.lighter if exchange == 'lighter' else self.binance
+        return await self._market_cache.get_or_set(
+            (exchange, 'position', symbol),
+            lambda: client.get_position(symbol),
+            ttl=POSITION_CACHE_TTL
+        )
+    
+    async def _get_price(self, symbol: str) -> Optional[Decimal]:
+        """获取 Lighter 当前价格（短时缓存）"""
+        return await self._market_cache.get_or_set(
+            ('lighter', 'price', symbol),
+            lambda: self.lighter.get_price(symbol),
+            ttl=PRICE_CACHE_TTL
+        )
+    
+    async def _prefetch_prices(self, symbols):
+        """批量获取 Lighter 价格并写入缓存"""
+        prices = await self.lighter.get_prices(list(symbols))
+        for symbol, price in prices.items():
+            self._market_cache.set(('lighter', 'price', symbol), price, PRICE_CACHE_TTL)
+    
+    async def _get_liquidation_price(self, exchange: str, symbol: str) -> Optional[Decimal]:
+        """获取爆仓价格（与持仓相同的短时缓存）"""
+        client = self.lighter if exchange == 'lighter' else self.binance
+        return await self._market_cache.get_or_set(
+            (exchange, 'liquidation_price', symbol),
+            lambda: client.get_liquidation_price(symbol),
+            ttl=POSITION_CACHE_TTL
+        )
+    
+    async def _get_balance(self, exchange: str) -> Optional[Decimal]:
+        """获取账户余额（短时缓存）"""
+        client = self.lighter if exchange == 'lighter' else self.binance
+        return await self._market_cache.get_or_set(
+            (exchange, 'balance', None),
+            client.get_balance,
+            ttl=BALANCE_CACHE_TTL
+        )
+    
+    def register_order(
+        self,
+        order_id: str,
+        symbol: str,
+        lighter_side: str,
+        stop_loss_price: Optional[Decimal],
+        take_profit_price: Optional[Decimal]
+    ):
+        """订单建仓完成后加入止损止盈监控"""
+        direction = 1.0 if lighter_side == 'long' else -1.0
+        self._stop_orders[order_id] = StopOrder(
+            order_id,
+            symbol,
+            direction,
+            direction * float(stop_loss_price) if stop_loss_price else float('-inf'),
+            direction * float(take_profit_price) if take_profit_price else float('inf'),
+            stop_loss_price,
+            take_profit_price
+        )
+    
+    def unregister_order(self, order_id: str):
+        """订单开始平仓后移出止损止盈监控"""
+        self._stop_orders.pop(order_id, None)
+    
+    def _load_stop_orders(self):
+        """从数据库加载已建仓订单（覆盖重启前建仓的订单）"""
+        try:
+            with self._read_db() as db:
+                rows = db.query(
+                    ArbitrageOrder.order_id,
+                    ArbitrageOrder.symbol,
+                    ArbitrageOrder.lighter_side,
+                    ArbitrageOrder.stop_loss_price,
+                    ArbitrageOrder.take_profit_price
+                ).filter(
+                    ArbitrageOrder.status == 'open'
+                ).all()
+            
+            for row in rows:
+                self.register_order(*row)
+            logger.info(f"止损止盈监控加载 {len(rows)} 个订单")
+        except Exception as e:
+            logger.error(f"加载止损止盈监控订单失败: {e}")
+    
+    async def _check_all(self, check, orders: List):
+        """并发检查所有订单，并发数受 MAX_CONCURRENT_CHECKS 限制，单个订单失败不影响其他订单"""
+        async def run(order):
+            async with self._check_semaphore:
+                await check(order)
+        
+        results = await asyncio.gather(
+            *(run(order) for order in orders),
+            return_exceptions=True
+        )
+        
+        for order, result in zip(orders, results):
+            if isinstance(result, Exception):
+                logger.error(f"风控检查失败 {order.order_id}: {result}")
+    
     async def _monitor_positions(self):
         """监控持仓风险"""
         while self.running:
             try:
-                with get_db_context() as db:
-                    # 获取所有开仓状态的订单
-                    orders = db.query(ArbitrageOrder).filter(
-                        ArbitrageOrder.status.in_(['open', 'opening'])
-                    ).all()
-                    
-                    for order in orders:
-                        await self._check_position_risk(order)
+                # 所有开仓状态的订单（读取共享快照，不查询数据库）
+                await self._check_all(self._check_position_risk, self._open_orders)
                 
             except Exception as e:
                 logger.error(f"监控持仓风险失败: {e}")
             
             await asyncio.sleep(5)  # 每5秒检查一次
     
-    async def _check_position_risk(self, order: ArbitrageOrder):
+    async def _check_position_risk(self, order: MonitoredOrder):
         """检查单个持仓的风险"""
         try:
             symbol = order.symbol
             
-            # 获取实时持仓
-            lighter_position = await self.lighter.get_position(symbol)
-            binance_position = await self.binance.get_position(symbol)
+            # 并发获取两边实时持仓
+            lighter_position, binance_position = await asyncio.gather(
+                self._get_position('lighter', symbol),
+                self._get_position('binance', symbol)
+            )
             
             if not lighter_position or not binance_position:
                 return
             
+            # 风控只做比较，统一按 float 计算，避免逐个 Decimal(str(...)) 转换
             # 检查持仓不平衡
-            lighter_amount = Decimal(str(lighter_position.get('amount', 0)))
-            binance_amount = Decimal(str(binance_position.get('amount', 0)))
+            lighter_amount = float(lighter_position.get('amount', 0))
+            binance_amount = float(binance_position.get('amount', 0))
             imbalance = abs(lighter_amount - binance_amount)
             total = lighter_amount + binance_amount
             
             if total > 0:
-                imbalance_ratio = float(imbalance / total)
+                imbalance_ratio = imbalance / total
                 
                 if imbalance_ratio > self.alert_thresholds['max_imbalance_ratio']:
                     self._log_alert(
@@ -96,17 +373,17 @@ class RiskManager:
                     )
             
             # 检查未实现盈亏
-            lighter_pnl = Decimal(str(lighter_position.get('unrealized_pnl', 0)))
-            binance_pnl = Decimal(str(binance_position.get('unrealized_pnl', 0)))
-            total_pnl = lighter_pnl + binance_pnl
+            total_pnl = (
+                float(lighter_position.get('unrealized_pnl', 0))
+                + float(binance_position.get('unrealized_pnl', 0))
+            )
             
             # 如果亏损超过初始投入的50%，发出警告
-            initial_investment = order.lighter_entry_amount + order.binance_entry_amount
-            if total_pnl < -initial_investment * Decimal('0.5'):
+            if total_pnl < -order.initial_investment * 0.5:
                 self._log_alert(
                     'high_loss',
                     f"亏损过高: {order.order_id}, 盈亏: {total_pnl}",
-                    {'order_id': order.order_id, 'pnl': float(total_pnl)}
+                    {'order_id': order.order_id, 'pnl': total_pnl}
                 )
         
         except Exception as e:
@@ -116,52 +393,40 @@ class RiskManager:
         """监控止损止盈触发"""
         while self.running:
             try:
-                with get_db_context() as db:
-                    orders = db.query(ArbitrageOrder).filter(
-                        ArbitrageOrder.status == 'open'
-                    ).all()
-                    
-                    for order in orders:
-                        await self._check_stop_loss_take_profit(order)
+                orders = list(self._stop_orders.values())
+                if orders:
+                    # 每个交易对只取一次价格（批量并发获取），之后各订单的检查命中缓存
+                    await self._prefetch_prices({o.symbol for o in orders})
+                    await self._check_all(self._check_stop_loss_take_profit, orders)
             
             except Exception as e:
                 logger.error(f"监控止损止盈失败: {e}")
             
             await asyncio.sleep(1)  # 每秒检查一次
     
-    async def _check_stop_loss_take_profit(self, order: ArbitrageOrder):
+    async def _check_stop_loss_take_profit(self, order: StopOrder):
         """检查止损止盈是否触发"""
         try:
             symbol = order.symbol
             
             # 获取当前价格
-            current_price = await self.lighter.get_price(symbol)
+            current_price = await self._get_price(symbol)
             if not current_price:
                 return
             
-            stop_loss = order.stop_loss_price
-            take_profit = order.take_profit_price
+            # 阈值在登记时已按方向换算，这里只需两次比较
+            scaled_price = order.direction * float(current_price)
+            long_side = order.direction > 0
             
             should_close = False
             reason = ""
             
-            # 检查止损
-            if stop_loss:
-                if order.lighter_side == 'long' and current_price <= stop_loss:
-                    should_close = True
-                    reason = f"触发止损 (价格 {current_price} <= 止损价 {stop_loss})"
-                elif order.lighter_side == 'short' and current_price >= stop_loss:
-                    should_close = True
-                    reason = f"触发止损 (价格 {current_price} >= 止损价 {stop_loss})"
-            
-            # 检查止盈
-            if take_profit and not should_close:
-                if order.lighter_side == 'long' and current_price >= take_profit:
-                    should_close = True
-                    reason = f"触发止盈 (价格 {current_price} >= 止盈价 {take_profit})"
-                elif order.lighter_side == 'short' and current_price <= take_profit:
-                    should_close = True
-                    reason = f"触发止盈 (价格 {current_price} <= 止盈价 {take_profit})"
+            if scaled_price <= order.stop_loss_bound:
+                should_close = True
+                reason = f"触发止损 (价格 {current_price} {'<=' if long_side else '>='} 止损价 {order.stop_loss_price})"
+            elif scaled_price >= order.take_profit_bound:
+                should_close = True
+                reason = f"触发止盈 (价格 {current_price} {'>=' if long_side else '<='} 止盈价 {order.take_profit_price})"
             
             if should_close:
                 logger.warning(f"{reason}, 准备平仓: {order.order_id}")
@@ -182,92 +447,53 @@ class RiskManager:
         """监控爆仓风险"""
         while self.running:
             try:
-                with get_db_context() as db:
-                    orders = db.query(ArbitrageOrder).filter(
-                        ArbitrageOrder.status == 'open'
-                    ).all()
-                    
-                    for order in orders:
-                        await self._check_liquidation_risk(order)
+                orders = [o for o in self._open_orders if o.status == 'open']
+                await self._check_all(self._check_liquidation_risk, orders)
             
             except Exception as e:
                 logger.error(f"监控爆仓风险失败: {e}")
             
             await asyncio.sleep(10)  # 每10秒检查一次
     
-    async def _check_liquidation_risk(self, order: ArbitrageOrder):
+    async def _check_liquidation_risk(self, order: MonitoredOrder):
         """检查爆仓风险"""
         try:
             symbol = order.symbol
             
-            # 获取当前价格
-            current_price = await self.lighter.get_price(symbol)
+            # 并发获取当前价格和两边爆仓价格
+            current_price, lighter_liq_price, binance_liq_price = await asyncio.gather(
+                self._get_price(symbol),
+                self._get_liquidation_price('lighter', symbol),
+                self._get_liquidation_price('binance', symbol)
+            )
             if not current_price:
                 return
             
-            # 获取爆仓价格
-            lighter_liq_price = await self.lighter.get_liquidation_price(symbol)
-            binance_liq_price = await self.binance.get_liquidation_price(symbol)
-            
-            buffer = Decimal(str(self.alert_thresholds['liquidation_buffer']))
+            price = float(current_price)
+            buffer = float(self.alert_thresholds['liquidation_buffer'])
             
-            # 检查 Lighter 爆仓风险
-            if lighter_liq_price:
-                if order.lighter_side == 'long':
-                    safe_price = lighter_liq_price * (1 + buffer)
-                    if current_price <= safe_price:
-                        self._log_alert(
-                            'liquidation_risk',
-                            f"Lighter 接近爆仓: {order.order_id}, 当前 {current_price}, 爆仓 {lighter_liq_price}",
-                            {
-                                'order_id': order.order_id,
-                                'exchange': 'lighter',
-                                'current_price': float(current_price),
-                                'liquidation_price': float(lighter_liq_price)
-                            }
-                        )
-                else:  # short
-                    safe_price = lighter_liq_price * (1 - buffer)
-                    if current_price >= safe_price:
-                        self._log_alert(
-                            'liquidation_risk',
-                            f"Lighter 接近爆仓: {order.order_id}, 当前 {current_price}, 爆仓 {lighter_liq_price}",
-                            {
-                                'order_id': order.order_id,
-                                'exchange': 'lighter',
-                                'current_price': float(current_price),
-                                'liquidation_price': float(lighter_liq_price)
-                            }
-                        )
-            
-            # 检查币安爆仓风险
-            if binance_liq_price:
-                if order.binance_side == 'long':
-                    safe_price = binance_liq_price * (1 + buffer)
-                    if current_price <= safe_price:
-                        self._log_alert(
-                            'liquidation_risk',
-                            f"币安接近爆仓: {order.order_id}, 当前 {current_price}, 爆仓 {binance_liq_price}",
-                            {
-                                'order_id': order.order_id,
-                                'exchange': 'binance',
-                                'current_price': float(current_price),
-                                'liquidation_price': float(binance_liq_price)
-                            }
-                        )
-                else:  # short
-                    safe_price = binance_liq_price * (1 - buffer)
-                    if current_price >= safe_price:
-                        self._log_alert(
-                            'liquidation_risk',
-                            f"币安接近爆仓: {order.order_id}, 当前 {current_price}, 爆仓 {binance_liq_price}",
-                            {
-                                'order_id': order.order_id,
-                                'exchange': 'binance',
-                                'current_price': float(current_price),
-                                'liquidation_price': float(binance_liq_price)
-                            }
-                        )
+            # 检查两边爆仓风险：多头价格跌近爆仓价、空头价格涨近爆仓价时告警
+            # 多头 sign=1、空头 sign=-1，警戒价 = 爆仓价 * (1 + sign * buffer)，sign * (价格 - 警戒价) <= 0 即告警
+            for exchange, name, side, liq_price in (
+                ('lighter', 'Lighter', order.lighter_side, lighter_liq_price),
+                ('binance', '币安', order.binance_side, binance_liq_price),
+            ):
+                if not liq_price:
+                    continue
+                
+                liq = float(liq_price)
+                sign = 1.0 if side == 'long' else -1.0
+                if sign * (price - liq * (1 + sign * buffer)) <= 0:
+                    self._log_alert(
+                        'liquidation_risk',
+                        f"{name} 接近爆仓: {order.order_id}, 当前 {current_price}, 爆仓 {liq_price}",
+                        {
+                            'order_id': order.order_id,
+                            'exchange': exchange,
+                            'current_price': price,
+                            'liquidation_price': liq
+                        }
+                    )
         
         except Exception as e:
             logger.error(f"检查爆仓风险失败: {e}")
@@ -276,9 +502,11 @@ class RiskManager:
         """监控账户余额"""
         while self.running:
             try:
-                # 获取余额
-                lighter_balance = await self.lighter.get_balance()
-                binance_balance = await self.binance.get_balance()
+                # 并发获取两边余额
+                lighter_balance, binance_balance = await asyncio.gather(
+                    self._get_balance('lighter'),
+                    self._get_balance('binance')
+                )
                 
                 # 检查余额是否过低
                 min_balance = Decimal('100')  # 最小余额 100 USDC
@@ -303,37 +531,48 @@ class RiskManager:
             await asyncio.sleep(60)  # 每分钟检查一次
     
     def _log_alert(self, level: str, message: str, details: dict = None):
-        """记录告警日志"""
+        """记录告警日志（入队，不阻塞监控循环）"""
         try:
             logger.warning(f"[{level.upper()}] {message}")
             
-            with get_db_context() as db:
-                log = SystemLog(
-                    level='WARNING',
-                    module='risk_manager',
-                    message=message,
-                    details=str(details) if details else None
-                )
-                db.add(log)
+            # 放入队列，由后台写入循环批量落库；队列满时丢弃最早的一条
+            alert = {
+                'level': 'WARNING',
+                'module': 'risk_manager',
+                'message': message,
+                'details': details or None
+            }
+            if self._alert_queue.full():
+                self._alert_queue.get_nowait()
+                self._alert_queue.task_done()
+                self._dropped_alerts += 1
+            self._alert_queue.put_nowait(alert)
         except Exception as e:
             logger.error(f"记录告警失败: {e}")
     
+    def _load_open_order_ids(self) -> List[str]:
+        """查询所有 open 订单的订单号"""
+        with get_db_context() as db:
+            return [
+                order_id for (order_id,) in db.query(ArbitrageOrder.order_id).filter(
+                    ArbitrageOrder.status == 'open'
+                ).all()
+            ]
+    
     async def emergency_close_all(self) -> bool:
         """紧急平仓所有持仓"""
         logger.warning("执行紧急平仓...")
         
         try:
-            with get_db_context() as db:
-                orders = db.query(ArbitrageOrder).filter(
-                    ArbitrageOrder.status == 'open'
-                ).all()
-                
-                for order in orders:
-                    logger.warning(f"紧急平仓: {order.order_id}")
-                    await self.executor.execute_close_position(
-                        order.order_id,
-                        Decimal('1000')  # 大金额快速平仓
-                    )
+            # 只取订单号，平仓期间不占用数据库连接
+            order_ids = await asyncio.to_thread(self._load_open_order_ids)
+            
+            for order_id in order_ids:
+                logger.warning(f"紧急平仓: {order_id}")
+                await self.executor.execute_close_position(
+                    order_id,
+                    Decimal('1000')  # 大金额快速平仓
+                )
             
             self._log_alert(
                 'emergency_close',
@@ -24,12 +24,24 @@ class StrategyEngine:
             'stop_loss_percent': settings.default_stop_loss_percent,
             'take_profit_percent': settings.default_take_profit_percent,
         }
+        self._rebuild_decimals()
         
         logger.info("策略引擎初始化成功")
     
+    def _rebuild_decimals(self):
+        """预先转换热路径使用的配置（Decimal / float），配置变更时重建"""
+        self.position_size_dec = Decimal(str(self.config['position_size_per_order']))
+        self.max_imbalance_dec = Decimal(str(self.config['max_imbalance']))
+        self.max_total_position_dec = Decimal(str(self.config['max_total_position']))
+        self.stop_loss_pct_dec = Decimal(str(self.config['stop_loss_percent']))
+        self.take_profit_pct_dec = Decimal(str(self.config['take_profit_percent']))
+        self.threshold_dec = Decimal(str(self.config['funding_rate_threshold']))
+        self.threshold = float(self.config['funding_rate_threshold'])
+    
     def update_config(self, new_config: dict):
         """更新配置"""
         self.config.update(new_config)
+        self._rebuild_decimals()
         logger.info(f"配置已更新: {new_config}")
     
     def check_arbitrage_opportunity(self, symbol: str) -> Optional[Dict]:
@@ -39,44 +51,52 @@ class StrategyEngine:
             if not rate_diff:
                 return None
             
-            current_diff = Decimal(str(rate_diff.get('current_diff', 0)))
-            avg_8h_diff = Decimal(str(rate_diff.get('avg_8h_diff', 0)))
-            threshold = Decimal(str(self.config['funding_rate_threshold']))
-            
-            if abs(current_diff) < threshold or abs(avg_8h_diff) < threshold:
-                return None
-            
-            if current_diff > 0:
-                strategy_type = 'lighter_short_binance_long'
-                lighter_side = 'short'
-                binance_side = 'long'
-            else:
-                strategy_type = 'lighter_long_binance_short'
-                lighter_side = 'long'
-                binance_side = 'short'
-            
-            return {
-                'symbol': symbol,
-                'strategy_type': strategy_type,
-                'lighter_side': lighter_side,
-                'binance_side': binance_side,
-                'current_diff': float(current_diff),
-                'avg_8h_diff': float(avg_8h_diff),
-                'lighter_rate': rate_diff.get('lighter_rate', 0),
-                'binance_rate': rate_diff.get('binance_rate', 0),
-                'expected_profit': float(abs(avg_8h_diff)),
-            }
+            return self._build_opportunity(symbol, rate_diff, self.threshold)
         except Exception as e:
             logger.error(f"检查套利机会失败: {e}")
             return None
     
+    @staticmethod
+    def _build_opportunity(symbol: str, rate_diff: Dict, threshold: float) -> Optional[Dict]:
+        """按阈值筛选费率差并生成套利机会（费率差在采集器中已是 float，直接比较）"""
+        current_diff = float(rate_diff.get('current_diff', 0))
+        avg_8h_diff = float(rate_diff.get('avg_8h_diff', 0))
+        
+        if abs(current_diff) < threshold or abs(avg_8h_diff) < threshold:
+            return None
+        
+        if current_diff > 0:
+            strategy_type = 'lighter_short_binance_long'
+            lighter_side = 'short'
+            binance_side = 'long'
+        else:
+            strategy_type = 'lighter_long_binance_short'
+            lighter_side = 'long'
+            binance_side = 'short'
+        
+        return {
+            'symbol': symbol,
+            'strategy_type': strategy_type,
+            'lighter_side': lighter_side,
+            'binance_side': binance_side,
+            'current_diff': current_diff,
+            'avg_8h_diff': avg_8h_diff,
+            'lighter_rate': rate_diff.get('lighter_rate', 0),
+            'binance_rate': rate_diff.get('binance_rate', 0),
+            'expected_profit': abs(avg_8h_diff),
+        }
+    
     def get_all_opportunities(self) -> list:
-        """获取所有交易对的套利机会"""
+        """获取所有交易对的套利机会（单次遍历费率差快照，阈值只转换一次）"""
         opportunities = []
         try:
-            all_rate_diffs = self.data_collector.get_all_rate_diffs()
-            for symbol in all_rate_diffs.keys():
-                opportunity = self.check_arbitrage_opportunity(symbol)
+            threshold = self.threshold
+            for symbol, rate_diff in self.data_collector.get_all_rate_diffs().items():
+                try:
+                    opportunity = self._build_opportunity(symbol, rate_diff, threshold)
+                except Exception as e:
+                    logger.error(f"检查套利机会失败: {e}")
+                    continue
                 if opportunity:
                     opportunities.append(opportunity)
         except Exception as e:
@@ -85,18 +105,17 @@ class StrategyEngine:
     
     def calculate_position_size(self, symbol: str, current_position: Decimal) -> Tuple[Decimal, int]:
         """计算建仓大小"""
-        max_position = Decimal(str(self.config['max_total_position']))
-        available = max_position - current_position
+        available = self.max_total_position_dec - current_position
         if available <= 0:
             return Decimal('0'), 0
-        position_size = min(Decimal(str(self.config['position_size_per_order'])), available)
+        position_size = min(self.position_size_dec, available)
         leverage = self.config['total_leverage']
         return position_size, leverage
     
     def calculate_stop_loss_take_profit(self, entry_price: Decimal, side: str) -> Tuple[Decimal, Decimal]:
         """计算止损止盈价格"""
-        stop_loss_pct = Decimal(str(self.config['stop_loss_percent']))
-        take_profit_pct = Decimal(str(self.config['take_profit_percent']))
+        stop_loss_pct = self.stop_loss_pct_dec
+        take_profit_pct = self.take_profit_pct_dec
         if side == 'long':
             stop_loss = entry_price * (1 - stop_loss_pct)
             take_profit = entry_price * (1 + take_profit_pct)
@@ -115,8 +134,7 @@ class StrategyEngine:
             if (entry_rate_diff > 0 and current_diff < 0) or (entry_rate_diff < 0 and current_diff > 0):
                 logger.info(f"费率差反转，建议平仓: {symbol}")
                 return True
-            threshold = Decimal(str(self.config['funding_rate_threshold']))
-            if abs(current_diff) < threshold / 2:
+            if abs(current_diff) < self.threshold_dec / 2:
                 logger.info(f"费率差缩小，建议平仓: {symbol}")
                 return True
             if current_holding_hours > 168:
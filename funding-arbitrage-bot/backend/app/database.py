@@ -1,4 +1,6 @@
 from sqlalchemy import create_engine
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.pool import NullPool
 from contextlib import contextmanager
@@ -9,12 +11,23 @@ import logging
 logger = logging.getLogger(__name__)
 
 # 创建数据库引擎
-engine = create_engine(
-    settings.database_url,
-    poolclass=NullPool,
-    echo=False,
-    pool_pre_ping=True
-)
+if settings.database_url.startswith('sqlite'):
+    # SQLite 是本地文件，建立连接开销很小，不需要连接池
+    engine = create_engine(
+        settings.database_url,
+        poolclass=NullPool,
+        echo=False
+    )
+else:
+    # 风控等后台循环每秒都会打开会话，复用连接避免每次重新握手和认证
+    engine = create_engine(
+        settings.database_url,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_recycle=settings.db_pool_recycle,
+        echo=False,
+        pool_pre_ping=True
+    )
 
 # 创建会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -39,6 +52,25 @@ def get_db() -> Session:
         db.close()
 
 
+def upsert(db: Session, model, values: dict, index_elements: list, update_columns: list):
+    """
+    构造 INSERT ... ON CONFLICT DO UPDATE 语句（支持 PostgreSQL 和 SQLite）
+    
+    Args:
+        db: 数据库会话
+        model: ORM 模型
+        values: 插入的列值
+        index_elements: 冲突判断使用的唯一列
+        update_columns: 冲突时需要更新的列
+    """
+    insert = pg_insert if db.get_bind().dialect.name == 'postgresql' else sqlite_insert
+    stmt = insert(model).values(**values)
+    return stmt.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={col: stmt.excluded[col] for col in update_columns}
+    )
+
+
 @contextmanager
 def get_db_context():
     """获取数据库会话的上下文管理器"""
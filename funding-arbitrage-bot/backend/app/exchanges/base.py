@@ -2,26 +2,30 @@
 Base exchange client interface - 适配自 perp-dex-tools
 """
 
+import asyncio
 from abc import ABC, abstractmethod
 from typing import Dict, Any, List, Optional, Tuple, Type, Union
 from dataclasses import dataclass
+from functools import lru_cache
 from decimal import Decimal, ROUND_HALF_UP
 from tenacity import RetryCallState, retry, retry_if_exception_type, stop_after_attempt, wait_exponential
 
 
-def query_retry(
-    default_return: Any = None,
-    exception_type: Union[Type[Exception], Tuple[Type[Exception], ...]] = (Exception,),
-    max_attempts: int = 5,
-    min_wait: float = 1,
-    max_wait: float = 10,
-    reraise: bool = False
+@lru_cache(maxsize=64, typed=True)
+def _make_retry(
+    default_return: Any,
+    exception_type: Union[Type[Exception], Tuple[Type[Exception], ...]],
+    max_attempts: int,
+    min_wait: float,
+    max_wait: float,
+    reraise: bool
 ):
     def retry_error_callback(retry_state: RetryCallState):
         print(f"Operation: [{retry_state.fn.__name__}] failed after {retry_state.attempt_number} retries, "
               f"exception: {str(retry_state.outcome.exception())}")
         return default_return
 
+    # tenacity.retry dispatches coroutine functions to AsyncRetrying by itself
     return retry(
         stop=stop_after_attempt(max_attempts),
         wait=wait_exponential(multiplier=1, min=min_wait, max=max_wait),
@@ -31,6 +35,23 @@ def query_retry(
     )
 
 
+def query_retry(
+    default_return: Any = None,
+    exception_type: Union[Type[Exception], Tuple[Type[Exception], ...]] = (Exception,),
+    max_attempts: int = 5,
+    min_wait: float = 1,
+    max_wait: float = 10,
+    reraise: bool = False
+):
+    """Return a retry decorator, reused across call sites with the same parameters."""
+    args = (default_return, exception_type, max_attempts, min_wait, max_wait, reraise)
+    try:
+        return _make_retry(*args)
+    except TypeError:
+        # Unhashable default_return (e.g. a list) cannot be cached
+        return _make_retry.__wrapped__(*args)
+
+
 @dataclass
 class OrderResult:
     """Standardized order result structure."""
@@ -44,6 +65,14 @@ class OrderResult:
     filled_size: Optional[Decimal] = None
 
 
+@dataclass
+class OrderSpec:
+    """Parameters of a single open order in a batch."""
+    contract_id: str
+    quantity: Decimal
+    direction: str
+
+
 @dataclass
 class OrderInfo:
     """Standardized order information structure."""
@@ -94,3 +123,13 @@ class BaseExchangeClient(ABC):
     async def place_close_order(self, contract_id: str, quantity: Decimal, price: Decimal, side: str) -> OrderResult:
         """Place a close order."""
         pass
+
+    async def place_orders_batch(self, orders: List[OrderSpec]) -> List[OrderResult]:
+        """Place several open orders at once.
+
+        Exchanges with a native batch endpoint should override this to send a
+        single request; the default places the orders concurrently.
+        """
+        return list(await asyncio.gather(
+            *(self.place_open_order(o.contract_id, o.quantity, o.direction) for o in orders)
+        ))
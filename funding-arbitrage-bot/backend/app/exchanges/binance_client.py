@@ -1,18 +1,39 @@
+import asyncio
 import logging
 from typing import Dict, Optional, List
 from decimal import Decimal
 from binance.client import Client
-from binance.exceptions import BinanceAPIException
 from ..config import settings
+from ..utils.cache import TTLCache
+from .binance_http import BinanceHttpPool
+from .binance_user_stream import BinanceUserDataStream
 
 logger = logging.getLogger(__name__)
 
+# 采集资金费率的主流交易对列表
+FUNDING_RATE_SYMBOLS = (
+    'BTCUSDT', 'ETHUSDT', 'BNBUSDT', 'SOLUSDT',
+    'ADAUSDT', 'DOGEUSDT', 'XRPUSDT', 'DOTUSDT',
+    'MATICUSDT', 'LINKUSDT', 'AVAXUSDT', 'UNIUSDT'
+)
+
+# 价格 / 单个资金费率的缓存时间（秒），同一时刻的并发请求合并为一次 REST 调用
+MARKET_CACHE_TTL = 0.2
+
 
 class BinanceClient:
-    """币安客户端 - 真实数据版"""
+    """
+    币安客户端 - 真实数据版
+    
+    公开行情（价格、资金费率）走 aiohttp 连接池并发请求；
+    账户相关的签名接口使用 python-binance 同步 Client，请求放到线程池执行，不阻塞事件循环
+    """
     
     def __init__(self):
         self.client = None
+        self.user_stream: Optional[BinanceUserDataStream] = None
+        self._market_cache = TTLCache(ttl=MARKET_CACHE_TTL)
+        self._http = BinanceHttpPool(settings.binance_testnet)
         self.initialized = False
         logger.info("币安客户端初始化")
     
@@ -21,15 +42,20 @@ class BinanceClient:
         try:
             # 如果没有配置 API 密钥，使用公开 API
             if settings.binance_api_key and settings.binance_api_secret:
-                self.client = Client(
+                self.client = await asyncio.to_thread(
+                    Client,
                     settings.binance_api_key,
                     settings.binance_api_secret,
                     testnet=settings.binance_testnet
                 )
                 logger.info("币安客户端已初始化（使用 API 密钥）")
+                
+                # 订阅用户数据流，持仓/余额由推送更新
+                self.user_stream = BinanceUserDataStream(self.client, settings.binance_testnet)
+                await self.user_stream.start()
             else:
                 # 使用公开 API（只读数据）
-                self.client = Client()
+                self.client = await asyncio.to_thread(Client)
                 logger.info("币安客户端已初始化（公开 API，只读模式）")
             
             self.initialized = True
@@ -38,14 +64,23 @@ class BinanceClient:
             logger.error(f"币安客户端初始化失败: {e}")
             self.initialized = False
     
-    async def get_funding_rate(self, symbol: str) -> Optional[Decimal]:
-        """获取单个交易对的资金费率"""
+    async def get_funding_rate(self, symbol: str, force: bool = False) -> Optional[Decimal]:
+        """获取单个交易对的资金费率（短时缓存，force=True 跳过缓存）"""
+        # 币安的 symbol 格式
+        symbol = symbol.upper()
+        return await self._market_cache.get_or_set(
+            ('funding_rate', symbol),
+            lambda: self._fetch_funding_rate(symbol),
+            force_refresh=force
+        )
+    
+    async def _fetch_funding_rate(self, symbol: str) -> Optional[Decimal]:
+        """请求单个交易对的资金费率"""
         try:
-            # 币安的 symbol 格式
-            symbol = symbol.upper()
-            
             # 获取资金费率
-            funding_info = self.client.futures_funding_rate(symbol=symbol, limit=1)
+            funding_info = await self._http.get(
+                '/fapi/v1/fundingRate', params={'symbol': symbol, 'limit': 1}
+            )
             
             if funding_info and len(funding_info) > 0:
                 rate = Decimal(str(funding_info[0]['fundingRate']))
@@ -54,28 +89,34 @@ class BinanceClient:
             
             return None
             
-        except BinanceAPIException as e:
-            logger.error(f"获取币安费率失败 {symbol}: {e}")
-            return None
         except Exception as e:
-            logger.error(f"获取币安费率异常 {symbol}: {e}")
+            logger.error(f"获取币安费率失败 {symbol}: {e}")
             return None
     
     async def get_all_funding_rates(self) -> Dict[str, Decimal]:
-        """获取所有交易对的资金费率"""
+        """获取所有交易对的资金费率（一次 premiumIndex 请求返回全部交易对）"""
         try:
-            # 主流交易对列表
-            symbols = [
-                'BTCUSDT', 'ETHUSDT', 'BNBUSDT', 'SOLUSDT',
-                'ADAUSDT', 'DOGEUSDT', 'XRPUSDT', 'DOTUSDT',
-                'MATICUSDT', 'LINKUSDT', 'AVAXUSDT', 'UNIUSDT'
-            ]
+            wanted = set(FUNDING_RATE_SYMBOLS)
             
-            rates = {}
-            for symbol in symbols:
-                rate = await self.get_funding_rate(symbol)
-                if rate is not None:
-                    rates[symbol] = rate
+            # 不带 symbol 的 /fapi/v1/premiumIndex 返回所有交易对，客户端过滤
+            try:
+                data = await self._http.get('/fapi/v1/premiumIndex')
+                rates = {
+                    d['symbol']: Decimal(str(d['lastFundingRate']))
+                    for d in data
+                    if d.get('symbol') in wanted and d.get('lastFundingRate') not in (None, '')
+                }
+            except Exception as e:
+                # 批量接口不可用时回退到逐个查询（并发执行）
+                logger.warning(f"批量获取币安费率失败，回退到逐个查询: {e}")
+                results = await asyncio.gather(
+                    *(self.get_funding_rate(symbol) for symbol in FUNDING_RATE_SYMBOLS)
+                )
+                rates = {
+                    symbol: rate
+                    for symbol, rate in zip(FUNDING_RATE_SYMBOLS, results)
+                    if rate is not None
+                }
             
             logger.info(f"获取到 {len(rates)} 个币安费率")
             return rates
@@ -84,11 +125,19 @@ class BinanceClient:
             logger.error(f"获取币安所有费率失败: {e}")
             return {}
     
-    async def get_price(self, symbol: str) -> Optional[Decimal]:
-        """获取当前价格"""
+    async def get_price(self, symbol: str, force: bool = False) -> Optional[Decimal]:
+        """获取当前价格（短时缓存，force=True 跳过缓存，如下单前取价）"""
+        symbol = symbol.upper()
+        return await self._market_cache.get_or_set(
+            ('price', symbol),
+            lambda: self._fetch_price(symbol),
+            force_refresh=force
+        )
+    
+    async def _fetch_price(self, symbol: str) -> Optional[Decimal]:
+        """请求当前价格"""
         try:
-            symbol = symbol.upper()
-            ticker = self.client.futures_symbol_ticker(symbol=symbol)
+            ticker = await self._http.get('/fapi/v1/ticker/price', params={'symbol': symbol})
             
             if ticker:
                 price = Decimal(str(ticker['price']))
@@ -100,27 +149,84 @@ class BinanceClient:
             logger.error(f"获取币安价格失败 {symbol}: {e}")
             return None
     
+    async def get_mark_price(self, symbol: str) -> Optional[Decimal]:
+        """获取标记价格（短时缓存）"""
+        symbol = symbol.upper()
+        return await self._market_cache.get_or_set(
+            ('mark_price', symbol),
+            lambda: self._fetch_mark_price(symbol)
+        )
+    
+    async def _fetch_mark_price(self, symbol: str) -> Optional[Decimal]:
+        """请求标记价格"""
+        try:
+            data = await self._http.get('/fapi/v1/premiumIndex', params={'symbol': symbol})
+            
+            if data:
+                return Decimal(str(data['markPrice']))
+            
+            return None
+            
+        except Exception as e:
+            logger.error(f"获取币安标记价格失败 {symbol}: {e}")
+            return None
+    
     async def get_balance(self) -> Optional[Decimal]:
-        """获取余额（需要 API 密钥）"""
+        """获取余额（需要 API 密钥），用户数据流连接时直接读取推送缓存"""
         if not settings.binance_api_key:
             return Decimal('0')  # 无 API 密钥返回 0
         
+        if self.user_stream:
+            balance = self.user_stream.get_balance()
+            if balance is not None:
+                return balance
+        
         try:
-            account = self.client.futures_account()
+            account = await asyncio.to_thread(self.client.futures_account)
             balance = Decimal(str(account['totalWalletBalance']))
+            if self.user_stream:
+                self.user_stream.seed_account(account)
             return balance
         except Exception as e:
             logger.error(f"获取币安余额失败: {e}")
             return Decimal('0')
     
+    async def ping(self) -> bool:
+        """轻量请求，用于预热合约接口的 HTTP 连接"""
+        if not self.client:
+            return False
+        
+        try:
+            await asyncio.to_thread(self.client.futures_ping)
+            return True
+        except Exception as e:
+            logger.warning(f"币安连接预热失败: {e}")
+            return False
+    
     async def get_position(self, symbol: str) -> Optional[Dict]:
-        """获取持仓（需要 API 密钥）"""
+        """获取持仓（需要 API 密钥），用户数据流连接时直接读取推送缓存"""
         if not settings.binance_api_key:
             return None
         
+        if self.user_stream:
+            position = self.user_stream.get_position(symbol)
+            if position is not None:
+                # 缓存只有数量和开仓价，未实现盈亏按当前标记价格计算（公开接口，无需签名）
+                mark_price = await self.get_mark_price(symbol)
+                if mark_price is not None:
+                    position_amt = Decimal(str(position['positionAmt']))
+                    entry_price = Decimal(str(position['entryPrice']))
+                    position['markPrice'] = str(mark_price)
+                    position['unRealizedProfit'] = str(position_amt * (mark_price - entry_price))
+                    return position
+        
         try:
-            positions = self.client.futures_position_information(symbol=symbol)
+            positions = await asyncio.to_thread(
+                self.client.futures_position_information, symbol=symbol
+            )
             if positions:
+                if self.user_stream:
+                    self.user_stream.seed_position(symbol, positions[0])
                 return positions[0]
             return None
         except Exception as e:
@@ -142,4 +248,7 @@ class BinanceClient:
     
     async def close(self):
         """关闭连接"""
-        pass
+        if self.user_stream:
+            await self.user_stream.stop()
+            self.user_stream = None
+        await self._http.close()
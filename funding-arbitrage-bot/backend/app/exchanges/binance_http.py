@@ -0,0 +1,61 @@
+"""
+币安合约公开行情 HTTP 连接池 - 基于 aiohttp 复用连接，并发请求不再排队等待同一个同步 Session
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+
+import aiohttp
+
+from ..utils import json_codec
+
+logger = logging.getLogger(__name__)
+
+# 合约 REST 地址
+FUTURES_BASE_URL = "https://fapi.binance.com"
+FUTURES_TESTNET_BASE_URL = "https://testnet.binancefuture.com"
+
+# 连接池大小 / 同时进行的请求数上限
+CONNECTION_LIMIT = 32
+CONNECTION_LIMIT_PER_HOST = 16
+MAX_CONCURRENT_REQUESTS = 16
+
+# 单次请求超时（秒）
+REQUEST_TIMEOUT = 10
+
+
+class BinanceHttpPool:
+    """公开行情接口（无需签名）的并发 HTTP 客户端，会话在首次请求时创建"""
+
+    def __init__(self, testnet: bool = False):
+        self.base_url = FUTURES_TESTNET_BASE_URL if testnet else FUTURES_BASE_URL
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """获取（必要时创建）共享会话"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=CONNECTION_LIMIT,
+                    limit_per_host=CONNECTION_LIMIT_PER_HOST
+                ),
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+            )
+        return self._session
+
+    async def get(self, path: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        """GET 请求并解析 JSON，HTTP 错误时抛出异常"""
+        async with self._semaphore:
+            async with self._get_session().get(self.base_url + path, params=params) as resp:
+                body = await resp.read()
+                if resp.status != 200:
+                    raise RuntimeError(f"币安 HTTP {resp.status} {path}: {body[:200]!r}")
+                return json_codec.loads(body)
+
+    async def close(self):
+        """关闭会话"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
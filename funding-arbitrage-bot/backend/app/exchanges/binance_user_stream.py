@@ -0,0 +1,192 @@
+"""
+币安合约用户数据流 - 通过 listenKey 订阅 ACCOUNT_UPDATE 推送，本地维护持仓和余额
+"""
+
+import asyncio
+import logging
+from decimal import Decimal
+from typing import Dict, Optional
+
+import websockets
+
+from ..utils import json_codec
+
+logger = logging.getLogger(__name__)
+
+# 用户数据流地址（后接 listenKey）
+USER_STREAM_URL = "wss://fstream.binance.com/ws/"
+USER_STREAM_TESTNET_URL = "wss://stream.binancefuture.com/ws/"
+
+# listenKey 有效期 60 分钟，每 30 分钟续期一次
+LISTEN_KEY_KEEPALIVE_INTERVAL = 30 * 60
+
+# 缓存的持仓字段：只保留成交时才变化的部分。未实现盈亏随标记价格变化而 ACCOUNT_UPDATE 不会推送，
+# 由 BinanceClient 按标记价格计算，不缓存
+POSITION_FIELDS = ('symbol', 'positionSide', 'positionAmt', 'entryPrice')
+
+# 保证金资产：totalWalletBalance 以 USD 计价，只有该资产的钱包余额变化可以直接累加
+MARGIN_ASSET = 'USDT'
+
+# 断线重连的退避时间（秒）
+RECONNECT_DELAY = 1
+MAX_RECONNECT_DELAY = 30
+
+
+class BinanceUserDataStream:
+    """币安用户数据流：推送驱动更新持仓/余额缓存，仅在连接正常时缓存有效"""
+
+    def __init__(self, client, testnet: bool = False):
+        self.client = client
+        self.ws_url = USER_STREAM_TESTNET_URL if testnet else USER_STREAM_URL
+        self.connected = False
+        self.running = False
+        self.listen_key: Optional[str] = None
+        # symbol -> 持仓（futures_position_information 返回字段中的 POSITION_FIELDS）
+        self._positions: Dict[str, Dict] = {}
+        # 资产 -> 钱包余额，用于按增量更新总余额
+        self._asset_balances: Dict[str, Decimal] = {}
+        self._balance: Optional[Decimal] = None
+        self._task: Optional[asyncio.Task] = None
+        self._ws = None
+
+    async def start(self):
+        """启动后台连接任务"""
+        if self._task is None:
+            self.running = True
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止数据流"""
+        self.running = False
+        if self._ws is not None:
+            try:
+                await self._ws.close()
+            except Exception as e:
+                logger.warning(f"关闭币安用户数据流失败: {e}")
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._reset()
+        logger.info("币安用户数据流已停止")
+
+    def get_position(self, symbol: str) -> Optional[Dict]:
+        """读取缓存持仓，未连接或尚未缓存时返回 None"""
+        if not self.connected:
+            return None
+        position = self._positions.get(symbol)
+        return dict(position) if position is not None else None
+
+    def get_balance(self) -> Optional[Decimal]:
+        """读取缓存余额，未连接或尚未缓存时返回 None"""
+        if not self.connected:
+            return None
+        return self._balance
+
+    def seed_position(self, symbol: str, position: Dict):
+        """用 REST 结果初始化持仓缓存（已有推送数据时不覆盖）"""
+        if self.connected and position.get('positionSide', 'BOTH') == 'BOTH':
+            self._positions.setdefault(symbol, {k: position[k] for k in POSITION_FIELDS if k in position})
+
+    def seed_account(self, account: Dict):
+        """用 REST 账户信息初始化余额缓存（已有数据时不覆盖）"""
+        if not self.connected or self._balance is not None:
+            return
+        try:
+            self._asset_balances = {
+                a['asset']: Decimal(str(a['walletBalance']))
+                for a in account.get('assets', [])
+            }
+            self._balance = Decimal(str(account['totalWalletBalance']))
+        except (KeyError, ValueError, TypeError) as e:
+            logger.warning(f"初始化币安余额缓存失败: {e}")
+
+    def _reset(self):
+        """断线后清空缓存，期间的变动只能通过 REST 重新获取"""
+        self.connected = False
+        self._positions.clear()
+        self._asset_balances.clear()
+        self._balance = None
+
+    def _handle_account_update(self, data: Dict):
+        """处理 ACCOUNT_UPDATE：推送只包含发生变化的资产和持仓"""
+        update = data.get('a', {})
+
+        for b in update.get('B', []):
+            asset = b['a']
+            wallet_balance = Decimal(str(b['wb']))
+            previous = self._asset_balances.get(asset, Decimal('0'))
+            self._asset_balances[asset] = wallet_balance
+            if self._balance is None or wallet_balance == previous:
+                continue
+            if asset == MARGIN_ASSET:
+                self._balance += wallet_balance - previous
+            else:
+                # 其他资产（BNB 等）折合 USD 的数值未知，缓存失效，下次查询走 REST 重新初始化
+                self._balance = None
+
+        for p in update.get('P', []):
+            symbol = p['s']
+            if p.get('ps', 'BOTH') != 'BOTH':
+                # 双向持仓模式下同一 symbol 有多条持仓，交给 REST 查询
+                self._positions.pop(symbol, None)
+                continue
+            position = self._positions.setdefault(symbol, {'symbol': symbol, 'positionSide': 'BOTH'})
+            position['positionAmt'] = p['pa']
+            position['entryPrice'] = p['ep']
+
+    async def _keepalive(self):
+        """定期续期 listenKey"""
+        while True:
+            await asyncio.sleep(LISTEN_KEY_KEEPALIVE_INTERVAL)
+            try:
+                await asyncio.to_thread(self.client.futures_stream_keepalive, listenKey=self.listen_key)
+                logger.debug("币安 listenKey 已续期")
+            except Exception as e:
+                logger.error(f"币安 listenKey 续期失败: {e}")
+
+    async def _run(self):
+        """连接循环：断线后按指数退避重连，每次重连重新获取 listenKey"""
+        reconnect_delay = RECONNECT_DELAY
+
+        while self.running:
+            keepalive_task = None
+            try:
+                self.listen_key = await asyncio.to_thread(self.client.futures_stream_get_listen_key)
+                async with websockets.connect(self.ws_url + self.listen_key) as self._ws:
+                    self.connected = True
+                    reconnect_delay = RECONNECT_DELAY
+                    keepalive_task = asyncio.create_task(self._keepalive())
+                    logger.info("币安用户数据流已连接")
+
+                    async for msg in self._ws:
+                        try:
+                            data = json_codec.loads(msg)
+                        except ValueError as e:
+                            logger.error(f"币安用户数据流 JSON 解析失败: {e}")
+                            continue
+
+                        event = data.get('e')
+                        if event == 'ACCOUNT_UPDATE':
+                            self._handle_account_update(data)
+                        elif event == 'ORDER_TRADE_UPDATE':
+                            # 成交引起的持仓/余额变化会随后以 ACCOUNT_UPDATE 推送
+                            order = data.get('o', {})
+                            logger.debug(f"币安订单更新 {order.get('s')}: {order.get('X')}")
+                        elif event == 'listenKeyExpired':
+                            logger.warning("币安 listenKey 已过期，重新连接")
+                            break
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"币安用户数据流异常: {e}")
+            finally:
+                if keepalive_task is not None:
+                    keepalive_task.cancel()
+                self._ws = None
+                self._reset()
+
+            if self.running:
+                logger.info(f"{reconnect_delay} 秒后重连币安用户数据流...")
+                await asyncio.sleep(reconnect_delay)
+                reconnect_delay = min(reconnect_delay * 2, MAX_RECONNECT_DELAY)
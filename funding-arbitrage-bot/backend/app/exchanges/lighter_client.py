@@ -6,16 +6,42 @@ Lighter 客户端 - 适配自 perp-dex-tools 项目
 import os
 import asyncio
 import logging
+import time
 from decimal import Decimal
-from typing import Dict, Optional, List
+from typing import Dict, Mapping, Optional, List
 from dataclasses import dataclass
+from functools import lru_cache
+from types import MappingProxyType
+
+import aiohttp
 
 # Import official Lighter SDK
 import lighter
 from lighter import SignerClient, ApiClient, Configuration
 
+from ..utils import json_codec
+
 logger = logging.getLogger(__name__)
 
+# HTTP 连接池：复用 TCP/TLS 连接，DNS 结果缓存 5 分钟
+HTTP_CONNECTION_LIMIT = 32
+HTTP_DNS_CACHE_TTL = 300
+HTTP_KEEPALIVE_TIMEOUT = 60
+HTTP_TIMEOUT = 10
+
+# 同时进行的 Lighter API 请求数上限（遵守接口限速）
+API_CONCURRENCY = 16
+
+# 认证令牌有效期（SDK 默认 10 分钟），到期前 30 秒重新签发
+AUTH_TOKEN_TTL = 10 * 60
+AUTH_TOKEN_REFRESH_MARGIN = 30
+
+# 标准化交易对时去掉的分隔符
+_SYMBOL_SEPARATORS = str.maketrans('', '', '_-')
+
+# Lighter 暂无资金费率接口时使用的占位费率
+PLACEHOLDER_FUNDING_RATE = Decimal('0.0001')
+
 
 @dataclass
 class SimpleConfig:
@@ -37,13 +63,29 @@ class LighterClient:
         self.account_index = settings.lighter_account_index
         self.api_key_index = settings.lighter_api_key_index
         self.base_url = "https://mainnet.zklighter.elliot.ai"
+        self.markets_cache_file = settings.lighter_markets_cache_file
+        self.markets_cache_ttl = settings.lighter_markets_cache_ttl
         
         # 初始化客户端
         self.lighter_client = None
         self.api_client = None
+        self.order_api = None
+        self.account_api = None
+        self.root_api = None
+        self._http: Optional[aiohttp.ClientSession] = None
         
         # 市场缓存
         self.markets_cache = {}
+        # 由 markets_cache 派生的查找表，加载市场后重建
+        self._symbol_to_market_id: Dict[str, int] = {}
+        self._normalized_symbols: tuple = ()
+        self._all_rates_view: Mapping[str, Decimal] = MappingProxyType({})
+        self._api_semaphore = asyncio.Semaphore(API_CONCURRENCY)
+        self._markets_refresh_task: Optional[asyncio.Task] = None
+        
+        # 认证令牌缓存（签名有计算开销，到期前复用）
+        self._auth_token: Optional[str] = None
+        self._auth_expiry = 0.0
         
         # 初始化状态
         self.initialized = False
@@ -53,10 +95,25 @@ class LighterClient:
     async def initialize(self):
         """初始化 Lighter 客户端"""
         try:
+            # 直接 HTTP 请求共用的会话
+            self._http = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=HTTP_CONNECTION_LIMIT,
+                    ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+                    keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT
+                ),
+                timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT),
+                json_serialize=json_codec.dumps
+            )
+            
             # 初始化 API 客户端
             self.api_client = ApiClient(
                 configuration=Configuration(host=self.base_url)
             )
+            # API 对象只是 api_client 的无状态包装，创建一次后复用
+            self.order_api = lighter.OrderApi(self.api_client)
+            self.account_api = lighter.AccountApi(self.api_client)
+            self.root_api = lighter.RootApi(self.api_client)
             
             # 如果有私钥，初始化签名客户端
             if self.api_key_private_key:
@@ -80,8 +137,12 @@ class LighterClient:
             else:
                 logger.warning("⚠️ Lighter API 密钥未配置")
             
-            # 加载市场信息（使用原始 JSON 跳过验证）
-            await self._load_markets_raw()
+            # 优先使用未过期的本地市场缓存，后台再从接口刷新；否则直接加载
+            if self._load_markets_from_file():
+                self._index_markets()
+                self._markets_refresh_task = asyncio.create_task(self._refresh_markets())
+            else:
+                await self._refresh_markets()
             
             self.initialized = True
             logger.info(f"✅ Lighter 客户端已初始化（找到 {len(self.markets_cache)} 个市场）")
@@ -92,85 +153,150 @@ class LighterClient:
             logger.error(traceback.format_exc())
             self.initialized = False
     
-    async def _load_markets_raw(self):
-        """直接加载市场信息（绕过 SDK 验证）"""
+    def _load_markets_from_file(self) -> bool:
+        """读取本地市场缓存，文件不存在或已过期时返回 False"""
         try:
-            import aiohttp
+            path = self.markets_cache_file
+            if not path or not os.path.exists(path):
+                return False
+            if time.time() - os.path.getmtime(path) >= self.markets_cache_ttl:
+                return False
             
+            with open(path, 'rb') as f:
+                markets = json_codec.loads(f.read())
+            if not markets:
+                return False
+            
+            self.markets_cache = markets
+            logger.info(f"从本地缓存加载了 {len(markets)} 个 Lighter 市场")
+            return True
+        except Exception as e:
+            logger.warning(f"读取 Lighter 市场缓存失败: {e}")
+            return False
+    
+    def _save_markets_to_file(self):
+        """写入本地市场缓存（先写临时文件再替换，避免读到半个文件）"""
+        if not self.markets_cache_file or not self.markets_cache:
+            return
+        
+        try:
+            path = self.markets_cache_file
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(json_codec.dumps(self.markets_cache))
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"写入 Lighter 市场缓存失败: {e}")
+    
+    async def _refresh_markets(self):
+        """
+        从接口加载市场信息（使用原始 JSON 跳过验证），整体替换市场缓存后重建查找表并写入本地缓存
+        
+        接口已下架或 frozen 的市场随替换一并移除；加载失败时保留现有缓存，也不刷新文件的修改时间
+        """
+        markets = await self._load_markets_raw()
+        if not markets:
+            logger.warning("未能从接口加载 Lighter 市场，保留现有市场缓存")
+            return
+        
+        self.markets_cache = markets
+        self._index_markets()
+        self._save_markets_to_file()
+    
+    async def _load_markets_raw(self) -> Dict[str, Dict]:
+        """直接加载市场信息（绕过 SDK 验证），返回新的 symbol -> 市场信息字典"""
+        try:
             url = f"{self.base_url}/order/order-books"
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=aiohttp.ClientTimeout(total=10)) as resp:
-                    if resp.status != 200:
-                        logger.error(f"获取市场列表失败: {resp.status}")
-                        # 尝试备用方法
-                        await self._load_markets_via_sdk()
-                        return
-                    
-                    data = await resp.json()
-                    
-                    if not data or 'order_books' not in data:
-                        logger.warning("未找到市场数据")
-                        await self._load_markets_via_sdk()
-                        return
+            async with self._http.get(url) as resp:
+                if resp.status != 200:
+                    logger.error(f"获取市场列表失败: {resp.status}")
+                    # 尝试备用方法
+                    return await self._load_markets_via_sdk()
+                
+                # 市场列表较大，使用 json_codec（安装了 orjson 时更快）解析
+                data = await resp.json(loads=json_codec.loads)
+                
+                if not data or 'order_books' not in data:
+                    logger.warning("未找到市场数据")
+                    return await self._load_markets_via_sdk()
+                
+                # 手动解析，忽略 status 验证；缺少字段的市场直接跳过，不逐条捕获异常
+                normalize = self._normalize_symbol
+                markets = {}
+                for market in data['order_books']:
+                    symbol = market.get('symbol')
+                    if not symbol:
+                        continue
                     
-                    # 手动解析，忽略 status 验证
-                    for market in data['order_books']:
-                        try:
-                            symbol = market.get('symbol', '')
-                            if not symbol:
-                                continue
-                            
-                            # 只处理活跃或非活跃市场，跳过 frozen
-                            status = market.get('status', '')
-                            if status == 'frozen':
-                                continue
-                            
-                            normalized_symbol = self._normalize_symbol(symbol)
-                            
-                            self.markets_cache[normalized_symbol] = {
-                                'market_id': market.get('market_id'),
-                                'symbol': symbol,
-                                'base_decimals': market.get('supported_size_decimals', 18),
-                                'price_decimals': market.get('supported_price_decimals', 18),
-                                'status': status,
-                            }
-                        except Exception as e:
-                            logger.debug(f"跳过市场 {market.get('symbol')}: {e}")
-                            continue
+                    # 只处理活跃或非活跃市场，跳过 frozen
+                    status = market.get('status', '')
+                    if status == 'frozen':
+                        continue
                     
-                    logger.info(f"通过 HTTP 加载了 {len(self.markets_cache)} 个 Lighter 市场")
+                    markets[normalize(symbol)] = {
+                        'market_id': market.get('market_id'),
+                        'symbol': symbol,
+                        'base_decimals': market.get('supported_size_decimals', 18),
+                        'price_decimals': market.get('supported_price_decimals', 18),
+                        'status': status,
+                    }
+                
+                logger.info(f"通过 HTTP 加载了 {len(markets)} 个 Lighter 市场")
+                return markets
         
         except Exception as e:
             logger.error(f"HTTP 加载市场失败: {e}")
             # 回退到 SDK 方法
-            await self._load_markets_via_sdk()
+            return await self._load_markets_via_sdk()
     
-    async def _load_markets_via_sdk(self):
-        """使用 SDK 加载（可能失败）"""
+    async def _load_markets_via_sdk(self) -> Dict[str, Dict]:
+        """使用 SDK 加载（可能失败），失败时返回空字典"""
+        markets = {}
         try:
-            order_api = lighter.OrderApi(self.api_client)
-            order_books = await order_api.order_books()
+            order_books = await self.order_api.order_books()
             
             if order_books and order_books.order_books:
                 for market in order_books.order_books:
                     symbol = market.symbol
                     normalized_symbol = self._normalize_symbol(symbol)
                     
-                    self.markets_cache[normalized_symbol] = {
+                    markets[normalized_symbol] = {
                         'market_id': market.market_id,
                         'symbol': market.symbol,
                         'base_decimals': market.supported_size_decimals,
                         'price_decimals': market.supported_price_decimals,
                     }
                 
-                logger.info(f"通过 SDK 加载了 {len(self.markets_cache)} 个市场")
+                logger.info(f"通过 SDK 加载了 {len(markets)} 个市场")
         except Exception as e:
             logger.error(f"SDK 加载市场也失败: {e}")
+        return markets
+    
+    async def _call(self, coro):
+        """在共享信号量下执行一次 API 请求，限制对交易所的并发请求数"""
+        async with self._api_semaphore:
+            return await coro
+    
+    def _index_markets(self):
+        """根据 markets_cache 预先构建 symbol -> market_id 查找表和交易对列表"""
+        self._symbol_to_market_id = {
+            symbol: market['market_id'] for symbol, market in self.markets_cache.items()
+        }
+        self._normalized_symbols = tuple(self.markets_cache)
+        # 占位费率在市场变化前不变，预先构建好并以只读视图返回，调用方无法修改
+        self._all_rates_view = MappingProxyType(
+            dict.fromkeys(self._normalized_symbols, PLACEHOLDER_FUNDING_RATE)
+        )
     
-    def _normalize_symbol(self, symbol: str) -> str:
-        """标准化交易对符号"""
-        normalized = symbol.replace('_', '').replace('-', '').upper()
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _normalize_symbol(symbol: str) -> str:
+        """标准化交易对符号（纯函数，结果缓存）"""
+        normalized = symbol.translate(_SYMBOL_SEPARATORS).upper()
         if not normalized.endswith('USDT'):
             normalized += 'USDT'
         return normalized
@@ -179,19 +305,16 @@ class LighterClient:
         """获取资金费率"""
         # Lighter 可能没有直接的 funding rate API
         # 返回占位符
-        return Decimal('0.0001')
+        return PLACEHOLDER_FUNDING_RATE
     
-    async def get_all_funding_rates(self) -> Dict[str, Decimal]:
+    async def get_all_funding_rates(self) -> Mapping[str, Decimal]:
         """获取所有交易对的资金费率"""
-        if not self.initialized or not self.markets_cache:
+        if not self.initialized or not self._normalized_symbols:
             return {}
         
         try:
-            rates = {}
-            
-            for normalized_symbol in self.markets_cache.keys():
-                # 返回占位符费率
-                rates[normalized_symbol] = Decimal('0.0001')
+            # 返回预先构建的占位符费率（只读视图，无需拷贝）
+            rates = self._all_rates_view
             
             logger.info(f"获取到 {len(rates)} 个 Lighter 市场费率")
             return rates
@@ -203,15 +326,13 @@ class LighterClient:
     async def get_price(self, symbol: str) -> Optional[Decimal]:
         """获取当前价格"""
         try:
-            normalized_symbol = self._normalize_symbol(symbol)
-            market_info = self.markets_cache.get(normalized_symbol)
+            market_id = self._symbol_to_market_id.get(self._normalize_symbol(symbol))
             
-            if not market_info:
+            if market_id is None:
                 return None
             
-            order_api = lighter.OrderApi(self.api_client)
-            market_summary = await order_api.order_book_details(
-                market_id=market_info['market_id']
+            market_summary = await self._call(
+                self.order_api.order_book_details(market_id=market_id)
             )
             
             if market_summary and market_summary.order_book_details:
@@ -226,31 +347,49 @@ class LighterClient:
             logger.error(f"获取 {symbol} 价格失败: {e}")
             return None
     
+    async def get_prices(self, symbols: List[str]) -> Dict[str, Optional[Decimal]]:
+        """批量获取价格：每个交易对一次请求，并发执行（并发数受 API_CONCURRENCY 限制）"""
+        unique_symbols = list(dict.fromkeys(symbols))
+        prices = await asyncio.gather(*(self.get_price(symbol) for symbol in unique_symbols))
+        return dict(zip(unique_symbols, prices))
+    
+    def _get_auth_token(self):
+        """获取认证令牌，未临近过期时复用缓存的令牌"""
+        now = time.time()
+        if self._auth_token and now < self._auth_expiry - AUTH_TOKEN_REFRESH_MARGIN:
+            return self._auth_token, None
+        
+        auth_token, error = self.lighter_client.create_auth_token_with_expiry()
+        if not error:
+            self._auth_token = auth_token
+            self._auth_expiry = now + AUTH_TOKEN_TTL
+        return auth_token, error
+    
     async def get_balance(self) -> Optional[Decimal]:
         """获取余额"""
         if not self.lighter_client:
             return Decimal('0')
         
         try:
-            account_api = lighter.AccountApi(self.api_client)
-            
             # 创建认证令牌
-            auth_token, error = self.lighter_client.create_auth_token_with_expiry()
+            auth_token, error = self._get_auth_token()
             if error:
                 return Decimal('0')
             
             # 获取账户信息（注意：不要传 auth 参数，SDK 会自动处理）
-            account_data = await account_api.account(
+            account_data = await self._call(self.account_api.account(
                 by="index",
                 value=str(self.account_index)
-            )
+            ))
             
-            if account_data and hasattr(account_data, 'accounts') and account_data.accounts:
-                account = account_data.accounts[0]
-                if hasattr(account, 'available_balance'):
-                    return Decimal(str(account.available_balance))
-                elif hasattr(account, 'balance'):
-                    return Decimal(str(account.balance))
+            accounts = getattr(account_data, 'accounts', None)
+            if accounts:
+                account = accounts[0]
+                balance = getattr(account, 'available_balance', None)
+                if balance is None:
+                    balance = getattr(account, 'balance', None)
+                if balance is not None:
+                    return Decimal(str(balance))
             
             return Decimal('0')
             
@@ -258,6 +397,18 @@ class LighterClient:
             logger.error(f"获取余额失败: {e}")
             return Decimal('0')
     
+    async def ping(self) -> bool:
+        """轻量请求，用于预热 API 客户端的连接池"""
+        if not self.root_api:
+            return False
+        
+        try:
+            await self.root_api.status()
+            return True
+        except Exception as e:
+            logger.warning(f"Lighter 连接预热失败: {e}")
+            return False
+    
     async def get_position(self, symbol: str) -> Optional[Dict]:
         """获取持仓"""
         return None
@@ -277,6 +428,14 @@ class LighterClient:
     
     async def close(self):
         """关闭连接"""
+        if self._markets_refresh_task and not self._markets_refresh_task.done():
+            self._markets_refresh_task.cancel()
+        self._markets_refresh_task = None
+        
+        if self._http and not self._http.closed:
+            await self._http.close()
+        self._http = None
+        
         if self.api_client:
             try:
                 await self.api_client.close()
@@ -1,11 +1,13 @@
 import logging
 import asyncio
+import queue
+from logging.handlers import QueueHandler, QueueListener
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from .config import settings
 from .database import init_db
-from .app_state import app_state, get_app_state, set_app_state
+from . import app_state
 from .api import routes, websocket
 from .core.data_collector import DataCollector
 from .core.strategy_engine import StrategyEngine
@@ -23,6 +25,13 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 日志经队列交给后台线程输出，避免事件循环在 stderr/文件 I/O 上阻塞
+log_queue = queue.SimpleQueue()
+root_logger = logging.getLogger()
+log_listener = QueueListener(log_queue, *root_logger.handlers, respect_handler_level=True)
+root_logger.handlers = [QueueHandler(log_queue)]
+log_listener.start()
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -35,37 +44,53 @@ async def lifespan(app: FastAPI):
     # 初始化交易所客户端
     lighter_client = LighterClient()
     binance_client = BinanceClient()
-    await lighter_client.initialize()
-    await binance_client.initialize()
+    # 两个交易所的初始化互不依赖，并发执行
+    results = await asyncio.gather(
+        lighter_client.initialize(),
+        binance_client.initialize(),
+        return_exceptions=True
+    )
+    for name, result in zip(('Lighter', '币安'), results):
+        if isinstance(result, Exception):
+            logger.error(f"{name} 客户端初始化异常: {result}")
     
     # 初始化核心模块
-    data_collector = DataCollector()
+    data_collector = DataCollector(lighter_client, binance_client)
     await data_collector.initialize()
     
     strategy_engine = StrategyEngine(data_collector)
     order_executor = OrderExecutor(lighter_client, binance_client)
+    await order_executor.prewarm()
     risk_manager = RiskManager(lighter_client, binance_client, order_executor)
+    order_executor.risk_manager = risk_manager
     position_manager = PositionManager(lighter_client, binance_client)
     pnl_calculator = PnLCalculator()
     
     # 保存到全局状态
-    app_state['data_collector'] = data_collector
-    app_state['strategy_engine'] = strategy_engine
-    app_state['order_executor'] = order_executor
-    app_state['risk_manager'] = risk_manager
-    app_state['position_manager'] = position_manager
-    app_state['pnl_calculator'] = pnl_calculator
-    app_state['lighter_client'] = lighter_client
-    app_state['binance_client'] = binance_client
+    app_state.data_collector = data_collector
+    app_state.strategy_engine = strategy_engine
+    app_state.order_executor = order_executor
+    app_state.risk_manager = risk_manager
+    app_state.position_manager = position_manager
+    app_state.pnl_calculator = pnl_calculator
+    app_state.lighter_client = lighter_client
+    app_state.binance_client = binance_client
+    app_state.refresh_modules_snapshot()
     
     # 启动后台任务
     logger.info("启动数据采集...")
     collector_task = asyncio.create_task(data_collector.start())
     
+    logger.info("启动订单执行器...")
+    executor_task = asyncio.create_task(order_executor.start())
+    
     logger.info("启动风险管理...")
     risk_task = asyncio.create_task(risk_manager.start())
     
-    app_state['tasks'] = [collector_task, risk_task]
+    logger.info("启动 WebSocket 推送...")
+    broadcast_task = asyncio.create_task(websocket.broadcast_loop())
+    
+    app_state.tasks = [collector_task, executor_task, risk_task, broadcast_task]
     
     logger.info("✅ 应用启动完成")
     
@@ -77,14 +102,17 @@ async def lifespan(app: FastAPI):
     # 停止后台任务
     await data_collector.stop()
     await risk_manager.stop()
+    await order_executor.stop()
     
-    for task in app_state.get('tasks', []):
+    for task in app_state.tasks:
         task.cancel()
     
     # 关闭客户端连接
     await lighter_client.close()
+    await binance_client.close()
     
     logger.info("✅ 应用已关闭")
+    log_listener.stop()
 
 
 # 创建 FastAPI 应用
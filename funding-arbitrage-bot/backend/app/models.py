@@ -1,10 +1,15 @@
-from sqlalchemy import Column, Integer, String, Numeric, BigInteger, DateTime, Text, Boolean
+from sqlalchemy import Column, Integer, String, Numeric, BigInteger, DateTime, Text, Boolean, Index, JSON
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 from datetime import datetime
 
 Base = declarative_base()
 
+# JSON 列：PostgreSQL 使用二进制存储的 JSONB，其他数据库使用通用 JSON（由驱动负责序列化）
+JSONType = JSON().with_variant(JSONB(), 'postgresql')
+NullableJSONType = JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), 'postgresql')
+
 
 class FundingRate(Base):
     """资金费率历史表"""
@@ -15,7 +20,12 @@ class FundingRate(Base):
     symbol = Column(String(20), nullable=False, index=True)  # 'BTCUSDC', 'ETHUSDC'
     funding_rate = Column(Numeric(10, 6), nullable=False)  # 资金费率
     timestamp = Column(BigInteger, nullable=False, index=True)  # 时间戳(毫秒)
-    created_at = Column(DateTime, default=func.now())
+    created_at = Column(DateTime, default=func.now(), server_default=func.now())
+    
+    __table_args__ = (
+        # 持仓期间资金费率汇总：按交易所、交易对和时间范围过滤，带上费率列以便只扫描索引
+        Index('idx_funding_rates_exchange_symbol_ts', 'exchange', 'symbol', 'timestamp', 'funding_rate'),
+    )
 
 
 class ArbitrageOrder(Base):
@@ -33,7 +43,7 @@ class ArbitrageOrder(Base):
     lighter_entry_amount = Column(Numeric(18, 8))
     lighter_filled_amount = Column(Numeric(18, 8), default=0)
     lighter_leverage = Column(Integer)
-    lighter_order_ids = Column(Text)  # JSON 数组，存储多个订单ID
+    lighter_order_ids = Column(JSONType)  # JSON 数组，存储多个订单ID
     
     # 币安端
     binance_side = Column(String(10), nullable=False)  # 'long' or 'short'
@@ -41,7 +51,7 @@ class ArbitrageOrder(Base):
     binance_entry_amount = Column(Numeric(18, 8))
     binance_filled_amount = Column(Numeric(18, 8), default=0)
     binance_leverage = Column(Integer)
-    binance_order_ids = Column(Text)  # JSON 数组
+    binance_order_ids = Column(JSONType)  # JSON 数组
     
     # 状态
     status = Column(String(20), nullable=False, index=True)  # 'opening', 'open', 'closing', 'closed'
@@ -54,8 +64,22 @@ class ArbitrageOrder(Base):
     # 费率信息
     entry_funding_rate_diff = Column(Numeric(10, 6))  # 建仓时的费率差
     
-    created_at = Column(DateTime, default=func.now())
-    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    created_at = Column(DateTime, default=func.now(), server_default=func.now())
+    updated_at = Column(DateTime, default=func.now(), server_default=func.now(), onupdate=func.now())
+    
+    __table_args__ = (
+        # 订单列表：按状态过滤并按创建时间倒序分页
+        Index('idx_orders_status_created', 'status', created_at.desc()),
+        # 持仓查询最常用的 open 状态
+        Index(
+            'idx_orders_open_created',
+            created_at.desc(),
+            postgresql_where=(status == 'open'),
+            sqlite_where=(status == 'open')
+        ),
+        # 按交易对查询持仓 / 历史订单：交易对 + 状态
+        Index('idx_orders_symbol_status', 'symbol', 'status'),
+    )
 
 
 class Trade(Base):
@@ -74,7 +98,12 @@ class Trade(Base):
     fee_currency = Column(String(10))
     exchange_order_id = Column(String(100))  # 交易所返回的订单ID
     timestamp = Column(BigInteger, nullable=False)
-    created_at = Column(DateTime, default=func.now())
+    created_at = Column(DateTime, default=func.now(), server_default=func.now())
+    
+    __table_args__ = (
+        # 盈亏计算：按订单和交易所聚合成交
+        Index('idx_trades_order_exchange', 'order_id', 'exchange'),
+    )
 
 
 class PnLRecord(Base):
@@ -104,10 +133,10 @@ class PnLRecord(Base):
     
     # 时间信息
     open_time = Column(DateTime)
-    closed_at = Column(DateTime)
+    closed_at = Column(DateTime, index=True)
     holding_hours = Column(Numeric(10, 2))  # 持仓小时数
     
-    created_at = Column(DateTime, default=func.now())
+    created_at = Column(DateTime, default=func.now(), server_default=func.now())
 
 
 class Config(Base):
@@ -118,7 +147,7 @@ class Config(Base):
     key = Column(String(50), unique=True, nullable=False)
     value = Column(Text, nullable=False)
     description = Column(Text)
-    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    updated_at = Column(DateTime, default=func.now(), server_default=func.now(), onupdate=func.now())
 
 
 class SystemLog(Base):
@@ -129,8 +158,8 @@ class SystemLog(Base):
     level = Column(String(20), nullable=False)  # 'INFO', 'WARNING', 'ERROR'
     module = Column(String(50))  # 模块名称
     message = Column(Text, nullable=False)
-    details = Column(Text)  # JSON 格式的详细信息
-    created_at = Column(DateTime, default=func.now(), index=True)
+    details = Column(NullableJSONType)  # JSON 格式的详细信息
+    created_at = Column(DateTime, default=func.now(), server_default=func.now(), index=True)
 
 
 class Symbol(Base):
@@ -147,5 +176,5 @@ class Symbol(Base):
     min_order_size = Column(Numeric(18, 8))  # 最小下单量
     price_precision = Column(Integer)  # 价格精度
     amount_precision = Column(Integer)  # 数量精度
-    created_at = Column(DateTime, default=func.now())
-    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    created_at = Column(DateTime, default=func.now(), server_default=func.now())
+    updated_at = Column(DateTime, default=func.now(), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,64 @@
+"""
+进程内 TTL 缓存
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """简单的进程内 TTL 缓存，过期时间基于 time.monotonic()；同一键的并发未命中只执行一次 factory"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._data: Dict[Hashable, Tuple[float, Any]] = {}
+        # 正在计算中的键，后到的调用方等待同一个结果
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """获取未过期的缓存值"""
+        entry = self._data.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            return default
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """写入缓存"""
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        """删除指定键，未指定时清空缓存"""
+        if key is None:
+            self._data.clear()
+        else:
+            self._data.pop(key, None)
+
+    async def get_or_set(
+        self,
+        key: Hashable,
+        factory: Callable[[], Awaitable[Any]],
+        force_refresh: bool = False,
+        ttl: Optional[float] = None
+    ) -> Any:
+        """命中则直接返回，否则调用 factory 计算并缓存结果（ttl 未指定时使用默认过期时间）"""
+        if not force_refresh:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                return entry[1]
+
+            inflight = self._inflight.get(key)
+            if inflight is not None:
+                # shield：单个调用方被取消不影响其他等待者
+                return await asyncio.shield(inflight)
+
+        future = asyncio.ensure_future(factory())
+        self._inflight[key] = future
+        try:
+            value = await asyncio.shield(future)
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+        self.set(key, value, ttl)
+        return value
@@ -0,0 +1,25 @@
+"""
+JSON 编解码 - 优先使用 orjson（可选依赖），未安装时回退到标准库 json
+"""
+
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 取决于部署环境
+    orjson = None
+
+
+def dumps(obj: Any) -> str:
+    """序列化为 JSON 字符串"""
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, ensure_ascii=False)
+
+
+def loads(data) -> Any:
+    """解析 JSON 字符串或字节"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
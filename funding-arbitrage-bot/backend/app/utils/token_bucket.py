@@ -0,0 +1,31 @@
+"""
+异步令牌桶 - 用于按交易所限速下单
+"""
+
+import asyncio
+import time
+
+
+class TokenBucket:
+    """异步令牌桶，令牌按时间惰性补充，不足时 acquire() 会等待"""
+
+    def __init__(self, capacity: float, refill_per_sec: float):
+        self.capacity = capacity
+        self.refill_per_sec = refill_per_sec
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.refill_per_sec)
+        self._last = now
+
+    async def acquire(self, tokens: float = 1):
+        """获取令牌，令牌不足时等待补充"""
+        async with self._lock:
+            while True:
+                self._refill(time.monotonic())
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.refill_per_sec)